@@ -1,64 +1,578 @@
 #!/usr/bin/env python3
 
+import hashlib
+import hmac
 import json
 import os
+import sys
+import time
+import signal
+import threading
 import requests
+from array import array
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+from bisect import bisect_right
+from collections import OrderedDict, namedtuple
+from math import isnan
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime, timedelta
 from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import urlsplit, parse_qs
 from dotenv import load_dotenv
 from caldav import DAVClient
+from caldav.elements import dav
+from caldav.lib import error as dav_error
 
 load_dotenv()
 
-WEATHER_API_URL = f"{os.getenv('WEATHER_API_URL')}?latitude={os.getenv('WEATHER_LAT')}&longitude={os.getenv('WEATHER_LONG')}&hourly=temperature_2m,wind_speed_10m,precipitation_probability&forecast_days=2"
-PUBLIC_TRANSPORT_API_URL = f"{os.getenv('PUBLIC_TRANSPORT_API_URL')}/{os.getenv('PUBLIC_TRANSPORT_STATION_ID')}?key={os.getenv('PUBLIC_TRANSPORT_API_KEY')}"
-CALENDAR_API_URL = os.getenv("CALENDAR_API_URL")
-CALENDAR_USERNAME = os.getenv("CALENDAR_USERNAME")
-CALENDAR_APP_PASSWORD = os.getenv("CALENDAR_APP_PASSWORD")
+libdir = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'lib')
+if os.path.exists(libdir):
+    sys.path.append(libdir)
 
-def get_weather_api_response():
-    try:
-        response = requests.get(WEATHER_API_URL, timeout=5)
+from waveshare_epd import framebuffer
+import main as display
+
+def weather_api_url(latitude, longitude):
+    return f"{os.getenv('WEATHER_API_URL')}?latitude={latitude}&longitude={longitude}&hourly=temperature_2m,wind_speed_10m,precipitation_probability&forecast_days=2&timeformat=unixtime"
+
+def public_transport_api_url(station_id):
+    return f"{os.getenv('PUBLIC_TRANSPORT_API_URL')}/{station_id}?key={os.getenv('PUBLIC_TRANSPORT_API_KEY')}"
+
+# JSON file with one profile per sign, selected by the sign's bearer
+# token. Without it the server has a single profile built from the
+# variables below.
+DEVICES_FILE = os.getenv("DEVICES_FILE", "")
+
+# /display?departures=absolute lists departures as epoch seconds up to
+# DEPARTURES_LOOKAHEAD minutes ahead, so the sign can count down by
+# itself. valid_until tells it when to ask again: after at most
+# DEPARTURES_VALID_FOR seconds, or once fewer than DEPARTURES_SHOWN
+# departures would be left.
+DEPARTURES_LOOKAHEAD = int(os.getenv("DEPARTURES_LOOKAHEAD", 60))
+DEPARTURES_VALID_FOR = int(os.getenv("DEPARTURES_VALID_FOR", 300))
+DEPARTURES_SHOWN = 3
+
+# /timeline serves TIMELINE_MINUTES pre-rendered frames, one per minute,
+# rebuilt in the background every TIMELINE_REBUILD seconds for each sign
+# that has asked for one. A sign's rebuilds stop after TIMELINE_IDLE_REBUILDS
+# in a row that nobody asked for, and start again with its next request.
+TIMELINE_MINUTES = int(os.getenv("TIMELINE_MINUTES", 15))
+TIMELINE_REBUILD = int(os.getenv("TIMELINE_REBUILD", 60))
+TIMELINE_IDLE_REBUILDS = int(os.getenv("TIMELINE_IDLE_REBUILDS", 30))
+
+# /display/wait holds a request for up to LONGPOLL_TIMEOUT seconds until
+# the sign's display content changes. While any sign waits, its content
+# is recomputed every DISPLAY_WATCH_INTERVAL seconds. At most
+# LONGPOLL_MAX requests may wait at once, leaving the other workers free.
+LONGPOLL_TIMEOUT = int(os.getenv("LONGPOLL_TIMEOUT", 50))
+LONGPOLL_MAX = int(os.getenv("LONGPOLL_MAX", 4))
+DISPLAY_WATCH_INTERVAL = int(os.getenv("DISPLAY_WATCH_INTERVAL", 30))
+
+# /frame?encoding=rle&base=<version> answers with an XOR delta against a
+# frame the sign still has, if it is one of the last FRAME_HISTORY frames
+# sent to that sign.
+FRAME_HISTORY = int(os.getenv("FRAME_HISTORY", 8))
+
+# Seconds an upstream response is served as fresh, and for how long after
+# that it may still be served (stale) while a background refresh runs.
+CACHE_TTL = {
+    "weather": int(os.getenv("WEATHER_CACHE_TTL", 600)),
+    "public_transport": int(os.getenv("PUBLIC_TRANSPORT_CACHE_TTL", 30)),
+    "calendar": int(os.getenv("CALENDAR_CACHE_TTL", 60)),
+}
+CACHE_STALE_TTL = {
+    "weather": int(os.getenv("WEATHER_CACHE_STALE_TTL", 3600)),
+    "public_transport": int(os.getenv("PUBLIC_TRANSPORT_CACHE_STALE_TTL", 120)),
+    "calendar": int(os.getenv("CALENDAR_CACHE_STALE_TTL", 3600)),
+}
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", 64))
+
+# /display waits at most DISPLAY_DEADLINE seconds for all upstreams
+# together; whatever is not back by then is left out of that response.
+DISPLAY_DEADLINE = float(os.getenv("DISPLAY_DEADLINE", 8))
+CALENDAR_TIMEOUT = int(os.getenv("CALENDAR_TIMEOUT", 10))
+# Recurring events are expanded this far ahead; the index is rebuilt when
+# the calendar changes or at the latest after CALENDAR_INDEX_MAX_AGE hours.
+CALENDAR_LOOKAHEAD_DAYS = int(os.getenv("CALENDAR_LOOKAHEAD_DAYS", 30))
+CALENDAR_INDEX_MAX_AGE = timedelta(hours=int(os.getenv("CALENDAR_INDEX_MAX_AGE", 6)))
+FETCH_POOL = ThreadPoolExecutor(max_workers=int(os.getenv("FETCH_WORKERS", 6)))
+
+# Connections are served by SERVER_WORKERS threads; an idle keep-alive
+# connection gives its worker back after KEEPALIVE_TIMEOUT seconds.
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", 8))
+KEEPALIVE_TIMEOUT = int(os.getenv("KEEPALIVE_TIMEOUT", 5))
+
+# Upstream HTTP calls share one keep-alive session. Failed connects and
+# 429/5xx answers are retried UPSTREAM_RETRIES times with exponential
+# backoff starting at UPSTREAM_BACKOFF seconds.
+UPSTREAM_RETRIES = int(os.getenv("UPSTREAM_RETRIES", 2))
+UPSTREAM_BACKOFF = float(os.getenv("UPSTREAM_BACKOFF", 0.5))
+
+class Flight:
+    # An upstream fetch in progress; callers that need the same key wait on
+    # it instead of starting their own.
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+
+class TTLCache:
+    # Upstream responses keyed by (source, query), evicted least recently
+    # used first once more than max_entries are held. Failed fetches
+    # (None) are never stored. At most one fetch per key runs at a time.
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.refreshing = set()
+        self.flights = {}
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "stale_hits": 0, "misses": 0, "evictions": 0, "coalesced": 0, "wait_timeouts": 0}
+
+    def get(self, source, key, fetch, deadline=None):
+        with self.lock:
+            entry = self.entries.get((source, key))
+            if entry is not None:
+                self.entries.move_to_end((source, key))
+                value, fetched_at = entry
+                age = time.monotonic() - fetched_at
+                if age < CACHE_TTL[source]:
+                    self.stats["hits"] += 1
+                    return value
+                if age < CACHE_TTL[source] + CACHE_STALE_TTL[source]:
+                    self.stats["stale_hits"] += 1
+                    if (source, key) not in self.refreshing:
+                        self.refreshing.add((source, key))
+                        threading.Thread(target=self._refresh, args=(source, key, fetch), daemon=True).start()
+                    return value
+            self.stats["misses"] += 1
+        return self._fetch_once(source, key, fetch, deadline)
+
+    def _refresh(self, source, key, fetch):
+        try:
+            self._fetch_once(source, key, fetch)
+        finally:
+            with self.lock:
+                self.refreshing.discard((source, key))
+
+    def _fetch_once(self, source, key, fetch, deadline=None):
+        with self.lock:
+            # A leader may have stored the value since the caller missed.
+            entry = self.entries.get((source, key))
+            if entry is not None and time.monotonic() - entry[1] < CACHE_TTL[source]:
+                self.stats["coalesced"] += 1
+                return entry[0]
+            flight = self.flights.get((source, key))
+            leader = flight is None
+            if leader:
+                flight = self.flights[(source, key)] = Flight()
+            else:
+                self.stats["coalesced"] += 1
+        if not leader:
+            # A follower gives up at the caller's deadline (time.monotonic())
+            # and makes do with a stale value, if one is still allowed.
+            timeout = None if deadline is None else max(0, deadline - time.monotonic())
+            if not flight.done.wait(timeout):
+                return self._stale(source, key)
+            return flight.value
+        try:
+            flight.value = self._fetch(source, fetch)
+            if flight.value is not None:
+                self._store(source, key, flight.value)
+        finally:
+            with self.lock:
+                del self.flights[(source, key)]
+            flight.done.set()
+        return flight.value
+
+    def _fetch(self, source, fetch):
+        try:
+            return fetch()
+        except Exception as e:
+            print(f"{source} fetch error: {e}")
+            return None
+
+    def _stale(self, source, key):
+        with self.lock:
+            self.stats["wait_timeouts"] += 1
+            entry = self.entries.get((source, key))
+            if entry is not None and time.monotonic() - entry[1] < CACHE_TTL[source] + CACHE_STALE_TTL[source]:
+                return entry[0]
+            return None
+
+    def _store(self, source, key, value):
+        with self.lock:
+            self.entries[(source, key)] = (value, time.monotonic())
+            self.entries.move_to_end((source, key))
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.stats, entries=len(self.entries))
+
+CACHE = TTLCache(CACHE_MAX_ENTRIES)
+
+class UpstreamClient:
+    # Pooled keep-alive session for the upstream APIs. A response that came
+    # with an ETag or Last-Modified is revalidated with a conditional GET
+    # next time, and a 304 hands back the body we already parsed.
+    def __init__(self, pool_size):
+        retry = Retry(total=UPSTREAM_RETRIES, read=0, backoff_factor=UPSTREAM_BACKOFF,
+                      status_forcelist=(429, 500, 502, 503, 504), allowed_methods=frozenset(["GET"]))
+        self.adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", self.adapter)
+        self.session.mount("https://", self.adapter)
+        # url -> (etag, last_modified, parsed body, body size on the wire)
+        self.validators = {}
+        self.lock = threading.Lock()
+        self.stats = {}
+
+    def get_json(self, url, timeout=5):
+        headers = {}
+        with self.lock:
+            cached = self.validators.get(url)
+        if cached is not None:
+            etag, last_modified = cached[0], cached[1]
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+        response = self.session.get(url, headers=headers, timeout=timeout)
+        host = urlsplit(url).hostname
+        if response.status_code == 304 and cached is not None:
+            self._count(host, not_modified=1, bytes_saved=cached[3])
+            return cached[2]
         response.raise_for_status()
-        return response.json()
+        body = response.json()
+        # Bytes read off the socket, before gzip is undone
+        size = response.raw.tell()
+        self._count(host, bytes_received=size)
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        with self.lock:
+            if etag or last_modified:
+                self.validators[url] = (etag, last_modified, body, size)
+            else:
+                self.validators.pop(url, None)
+        return body
+
+    def _count(self, host, **counts):
+        with self.lock:
+            host_stats = self.stats.setdefault(host, {"requests": 0, "not_modified": 0, "bytes_received": 0, "bytes_saved": 0})
+            host_stats["requests"] += 1
+            for name, value in counts.items():
+                host_stats[name] += value
+
+    def snapshot(self):
+        with self.lock:
+            return {host: dict(counts) for host, counts in self.stats.items()}
+
+UPSTREAM = UpstreamClient(int(os.getenv("FETCH_WORKERS", 6)))
+
+def get_weather_api_response(url):
+    try:
+        api_response = UPSTREAM.get_json(url, timeout=5)
+        return WeatherForecast(api_response["hourly"])
     except Exception as e:
         print(f"Weather API error: {e}")
         return None
     
-def get_public_transport_api_response():
+def get_public_transport_api_response(url):
     try:
-        response = requests.get(PUBLIC_TRANSPORT_API_URL, timeout=5)
-        response.raise_for_status()
-        return response.json()
+        return UPSTREAM.get_json(url, timeout=5)
     except Exception as e:
         print(f"Public Transport API error: {e}")
         return None
 
-def get_next_event_api_response():
-    client = DAVClient(url=CALENDAR_API_URL, username=CALENDAR_USERNAME, password=CALENDAR_APP_PASSWORD)
-    principal = client.principal()
-    calendars = principal.calendars()
+class CalendarSession:
+    # Long-lived CalDAV session. Principal and calendar discovery happen
+    # once; after that a refresh is one PROPFIND of the collection's
+    # sync-token and, only when it moved, a sync-collection REPORT that
+    # loads just the changed objects (by ETag). Parsed events stay in
+    # memory keyed by URL, with one event index per timezone asked for.
+    def __init__(self, url, username, password, number):
+        self.url = url
+        self.username = username
+        self.password = password
+        self.number = number
+        self.lock = threading.Lock()
+        self.calendar = None
+        self.collection = None
+        self.sync_token = None
+        self.events = {}
+        self.indexes = {}
+        self.stats = {"discoveries": 0, "unchanged": 0, "syncs": 0, "resyncs": 0, "objects_loaded": 0,
+                      "index_builds": 0}
 
-    if not calendars:
-        print("No calendars found!")
-        return None
+    def _discover(self):
+        client = DAVClient(url=self.url, username=self.username, password=self.password, timeout=CALENDAR_TIMEOUT)
+        calendars = client.principal().calendars()
+        self.stats["discoveries"] += 1
+        if not calendars:
+            print("No calendars found!")
+            return None
+        return calendars[self.number]
+
+    def _server_sync_token(self):
+        try:
+            return self.calendar.get_property(dav.SyncToken())
+        except Exception:
+            return None
+
+    def event_index(self, tz=None):
+        events = self.refresh()
+        with self.lock:
+            now = local_now(tz)
+            index = self.indexes.get(tz)
+            if index is None or now - index.built_at > CALENDAR_INDEX_MAX_AGE:
+                index = self.indexes[tz] = build_event_index(events, now, tz=tz)
+                self.stats["index_builds"] += 1
+            return index
+
+    def refresh(self):
+        with self.lock:
+            try:
+                if self.calendar is None:
+                    self.calendar = self._discover()
+                    if self.calendar is None:
+                        return []
+                token = self._server_sync_token()
+                if self.collection is not None and token is not None and token == self.sync_token:
+                    self.stats["unchanged"] += 1
+                    return list(self.events.values())
+                updated = None
+                if self.collection is not None:
+                    try:
+                        updated, _ = self.collection.sync()
+                    except dav_error.DAVError as e:
+                        # Expired or unknown sync-token: load everything again
+                        print(f"Calendar sync error, reloading: {e}")
+                        self.stats["resyncs"] += 1
+                if updated is None:
+                    self.collection = self.calendar.objects_by_sync_token(load_objects=True)
+                    updated = list(self.collection)
+                self.stats["syncs"] += 1
+                self.stats["objects_loaded"] += len(updated)
+                self.sync_token = token
+                self.events = {
+                    str(obj.url): obj
+                    for obj in self.collection
+                    if obj.data and hasattr(obj.vobject_instance, "vevent")
+                }
+                self.indexes = {}
+                return list(self.events.values())
+            except Exception:
+                # Start over with discovery next time
+                self.calendar = None
+                self.collection = None
+                raise
+
+# One session per calendar, shared by every profile showing it.
+CALENDAR_SESSIONS = {}
+
+def calendar_session(url, username, password, number):
+    key = (url, username, number)
+    if key not in CALENDAR_SESSIONS:
+        CALENDAR_SESSIONS[key] = CalendarSession(url, username, password, number)
+    return CALENDAR_SESSIONS[key]
+
+def get_timezone(name):
+    try:
+        from zoneinfo import ZoneInfo
+        return ZoneInfo(name)
+    except ImportError:
+        import pytz
+        return pytz.timezone(name)
+
+def local_now(tz=None):
+    # Calendar times are kept as naive wall-clock time in the sign's zone.
+    if tz is None:
+        return datetime.now()
+    return datetime.now(tz).replace(tzinfo=None)
 
-    calendar = calendars[int(os.getenv("CALENDAR_NUMBER", 0))]
-    today = datetime.now()
-    future = today + timedelta(days=30)
-    results = calendar.search(start=today, end=future)
+class Profile:
+    # What one sign shows. Signs with the same station, location or
+    # calendar get the same upstream URLs and CalendarSession, so their
+    # fetches land on the same cache entries.
+    def __init__(self, name, api_key="", station_id="", destinations=(), latitude="", longitude="",
+                 timezone="Europe/Stockholm", calendar=None):
+        self.name = name
+        self.api_key = api_key
+        self.weather_url = weather_api_url(latitude, longitude)
+        self.public_transport_url = public_transport_api_url(station_id)
+        self.destinations = [d.strip() for d in destinations if d.strip()]
+        self.timezone = timezone
+        self.tz = get_timezone(timezone)
+        self.calendar = None
+        if calendar and calendar.get("url"):
+            self.calendar = calendar_session(calendar["url"], calendar.get("username"), calendar.get("password"),
+                                             int(calendar.get("number", 0)))
 
-    if results:
-        next_event = results[0]
-        return next_event
+def load_profiles(path):
+    if not path:
+        return [Profile(
+            "default",
+            api_key=os.getenv("API_KEY", ""),
+            station_id=os.getenv("PUBLIC_TRANSPORT_STATION_ID"),
+            destinations=os.getenv("PUBLIC_TRANSPORT_SELECT_DESTINATIONS", "").split(","),
+            latitude=os.getenv("WEATHER_LAT"),
+            longitude=os.getenv("WEATHER_LONG"),
+            timezone=os.getenv("LOCAL_TIMEZONE", "Europe/Stockholm"),
+            calendar={
+                "url": os.getenv("CALENDAR_API_URL"),
+                "username": os.getenv("CALENDAR_USERNAME"),
+                "password": os.getenv("CALENDAR_APP_PASSWORD"),
+                "number": os.getenv("CALENDAR_NUMBER", 0),
+            },
+        )]
+    with open(path) as f:
+        devices = json.load(f)["devices"]
+    profiles = [Profile(**device) for device in devices]
+    for profile in profiles:
+        if not profile.api_key:
+            raise ValueError(f"{path}: device {profile.name!r} has no api_key")
+    if len({profile.name for profile in profiles}) != len(profiles):
+        raise ValueError(f"{path}: device names must be unique")
+    return profiles
+
+PROFILES = load_profiles(DEVICES_FILE)
+
+def find_profile(token):
+    # Every key is compared in constant time and the loop never stops
+    # early, so timing tells nothing about which key came close. Only the
+    # env-configured profile may have no key, which leaves the server open
+    # as it was before keys were checked.
+    found = None
+    for profile in PROFILES:
+        if not profile.api_key:
+            found = found or profile
+        elif hmac.compare_digest(profile.api_key.encode(), token.encode()):
+            found = profile
+    return found
+
+def get_next_event_api_response(session, tz):
+    return session.event_index(tz)
+
+Occurrence = namedtuple("Occurrence", ["start", "end", "summary"])
+
+class EventIndex:
+    # Every occurrence in the lookahead window, recurring events expanded,
+    # sorted by end time. earliest[i] is the position of the occurrence
+    # with the earliest start among occurrences[i:], so the event that is
+    # on now or comes next is one bisect away and needs no network.
+    def __init__(self, occurrences, built_at):
+        self.built_at = built_at
+        self.occurrences = sorted(occurrences, key=lambda occurrence: (occurrence.end, occurrence.start))
+        self.ends = [occurrence.end for occurrence in self.occurrences]
+        self.earliest = [0] * len(self.occurrences)
+        best = None
+        for i in range(len(self.occurrences) - 1, -1, -1):
+            if best is None or self.occurrences[i].start <= self.occurrences[best].start:
+                best = i
+            self.earliest[i] = best
+
+    def __len__(self):
+        return len(self.occurrences)
+
+    def next_event(self, now):
+        i = bisect_right(self.ends, now)
+        if i == len(self.occurrences):
+            return None
+        return self.occurrences[self.earliest[i]]
+
+def build_event_index(objects, now, lookahead=timedelta(days=CALENDAR_LOOKAHEAD_DAYS), tz=None):
+    occurrences = []
+    for obj in objects:
+        vevents = obj.vobject_instance.vevent_list
+        # Modified instances of a recurring event come as extra VEVENTs
+        # with a RECURRENCE-ID and replace the generated occurrence.
+        overridden = {as_naive_local(vevent.recurrence_id.value, tz) for vevent in vevents if hasattr(vevent, "recurrence_id")}
+        for vevent in vevents:
+            skip = overridden if not hasattr(vevent, "recurrence_id") else ()
+            occurrences.extend(expand_event(vevent, now, now + lookahead, skip, tz))
+    return EventIndex(occurrences, now)
+
+def expand_event(vevent, window_start, window_end, skip=(), tz=None):
+    dtstart = vevent.dtstart.value
+    all_day = not isinstance(dtstart, datetime)
+    start = as_naive_local(dtstart, tz)
+    if hasattr(vevent, "dtend"):
+        length = as_naive_local(vevent.dtend.value, tz) - start
+    elif hasattr(vevent, "duration"):
+        length = vevent.duration.value
+    elif all_day:
+        length = timedelta(days=1)
     else:
-        print("No upcoming events found")
-        return None
+        length = timedelta(0)
+    summary = vevent.summary.value if hasattr(vevent, "summary") else ""
+
+    if hasattr(vevent, "rrule") or hasattr(vevent, "rdate"):
+        after, before = window_start - length, window_end
+        if not all_day and dtstart.tzinfo is not None:
+            after, before = as_aware(after, tz), as_aware(before, tz)
+        starts = [as_naive_local(value, tz) for value in vevent.getrruleset(addRDate=True).between(after, before, inc=True)]
+    else:
+        starts = [start]
+    for start in starts:
+        if start not in skip and start < window_end and start + length > window_start:
+            yield Occurrence(start, start + length, summary)
+
+def as_naive_local(value, tz=None):
+    if not isinstance(value, datetime):
+        return datetime(value.year, value.month, value.day)
+    if value.tzinfo is not None:
+        if hasattr(value.tzinfo, "localize"):
+            # rrule carries DTSTART's pytz offset past DST changes; the
+            # wall-clock time is the right one, so localize it again.
+            value = value.tzinfo.localize(value.replace(tzinfo=None))
+        return value.astimezone(tz).replace(tzinfo=None)
+    return value
+
+def as_aware(value, tz=None):
+    if tz is None:
+        return value.astimezone()
+    if hasattr(tz, "localize"):
+        return tz.localize(value)
+    return value.replace(tzinfo=tz)
+
+def timed_fetch(source, key, fetch, deadline=None):
+    started = time.monotonic()
+    value = CACHE.get(source, key, fetch, deadline)
+    return value, round((time.monotonic() - started) * 1000)
+
+def get_display_data(profile=None, absolute=False):
+    # The three upstreams are fetched in parallel under one deadline. The
+    # cache is keyed by upstream URL (or calendar session), not by sign.
+    profile = profile or PROFILES[0]
+    deadline = time.monotonic() + DISPLAY_DEADLINE
+    futures = {
+        "weather": FETCH_POOL.submit(timed_fetch, "weather", profile.weather_url,
+                                     lambda: get_weather_api_response(profile.weather_url), deadline),
+        "public_transport": FETCH_POOL.submit(timed_fetch, "public_transport", profile.public_transport_url,
+                                              lambda: get_public_transport_api_response(profile.public_transport_url),
+                                              deadline),
+    }
+    if profile.calendar is not None:
+        futures["calendar"] = FETCH_POOL.submit(timed_fetch, "calendar", (profile.calendar, profile.tz),
+                                                lambda: get_next_event_api_response(profile.calendar, profile.tz),
+                                                deadline)
+    done, _ = wait(futures.values(), timeout=DISPLAY_DEADLINE)
+    results = {}
+    latency_ms = {}
+    timed_out = []
+    for source, future in futures.items():
+        if future in done:
+            results[source], latency_ms[source] = future.result()
+        else:
+            results[source] = None
+            timed_out.append(source)
+            print(f"{source} missed the {DISPLAY_DEADLINE}s deadline")
 
-def get_display_data():
-    weather_api_response = get_weather_api_response()
-    if weather_api_response and "hourly" in weather_api_response:
-        weather = process_weather(weather_api_response)
+    forecast = results["weather"]
+    if forecast:
+        weather = process_weather(forecast, profile.tz)
     else:
         weather = {
             "current_temp": "N/A",
@@ -69,35 +583,36 @@ def get_display_data():
             "precipitation": "N/A"
         }
 
-    public_transport = get_public_transport_api_response()
-    if public_transport:
-        buses = process_public_transport(public_transport)
+    public_transport = results["public_transport"]
+    if public_transport and absolute:
+        buses = process_departures(public_transport, profile.destinations, profile.tz)
+    elif public_transport:
+        buses = process_public_transport(public_transport, profile.destinations, profile.tz)
     else:
         buses = []
 
-    next_event = get_next_event_api_response()
-    if next_event:
-        calendar = process_next_event(next_event)
+    event_index = results.get("calendar")
+    if event_index:
+        calendar = process_next_event(event_index, profile.tz)
     else:
         calendar = {}
 
-    return {
+    data = {
         "buses": buses,
         "weather": weather,
-        "calendar": calendar
+        "calendar": calendar,
+        "meta": {
+            "latency_ms": latency_ms,
+            "timed_out": timed_out
+        }
     }
+    if absolute:
+        # The sign formats the departure clock times itself, in this zone.
+        data["tz"] = profile.timezone
+        data["valid_until"] = departures_valid_until(buses, int(time.time()))
+    return data
 
-def process_public_transport(api_response):
-    try:
-        from zoneinfo import ZoneInfo
-        tz = ZoneInfo(os.getenv("LOCAL_TIMEZONE", "Europe/Stockholm"))
-    except ImportError:
-        import pytz
-        tz = pytz.timezone(os.getenv("LOCAL_TIMEZONE", "Europe/Stockholm"))
-    allowed_dest = os.getenv("PUBLIC_TRANSPORT_SELECT_DESTINATIONS", "").split(",")
-    allowed_dest = [d.strip() for d in allowed_dest if d.strip()]
-    now = datetime.now(tz)
-    result = []
+def parse_departures(api_response, allowed_dest, tz):
     for dep in api_response.get("departures", []):
         if dep.get("canceled", False):
             continue
@@ -114,6 +629,12 @@ def process_public_transport(api_response):
                 realtime_dt = realtime_dt.astimezone(tz)
         except Exception:
             continue
+        yield number, dest_name, realtime_dt
+
+def process_public_transport(api_response, allowed_dest, tz):
+    now = datetime.now(tz)
+    result = []
+    for number, dest_name, realtime_dt in parse_departures(api_response, allowed_dest, tz):
         diff_min = int((realtime_dt - now).total_seconds() // 60)
         time_val = realtime_dt.strftime("%H:%M")
         if 0 <= diff_min < 30:
@@ -131,72 +652,111 @@ def process_public_transport(api_response):
         })
     return result
 
-def process_weather(api_response):
-    try:
-        from zoneinfo import ZoneInfo
-        tz = ZoneInfo("Europe/Stockholm")
-    except ImportError:
-        import pytz
-        tz = pytz.timezone("Europe/Stockholm")
-    hourly = api_response["hourly"]
-    times = hourly["time"]
-    temps = hourly["temperature_2m"]
-    winds = hourly["wind_speed_10m"]
-    precs = hourly["precipitation_probability"]
+def process_departures(api_response, allowed_dest, tz):
+    # Upcoming departures in time order, with the departure as epoch
+    # seconds; minutes and clock time are left to the sign.
+    now = time.time()
+    result = []
+    for number, dest_name, realtime_dt in parse_departures(api_response, allowed_dest, tz):
+        departure = int(realtime_dt.timestamp())
+        if now - 60 < departure <= now + DEPARTURES_LOOKAHEAD * 60:
+            result.append({
+                "number": number,
+                "destination": dest_name,
+                "departure": departure
+            })
+    result.sort(key=lambda bus: bus["departure"])
+    return result
 
-    now = datetime.now(tz)
-    now_str = now.strftime("%Y-%m-%dT%H:00")
-    try:
-        idx = times.index(now_str)
-    except ValueError:
-        idx = 0  
-
-    current_temp = temps[idx]
-    wind_kmh = winds[idx]
-    later_idx = min(idx + 4, len(temps) - 1)
-    later_temp = temps[later_idx]
-    later_temp_time_raw = times[later_idx]
-    try:
-        hour = int(later_temp_time_raw[11:13])
-    except Exception:
-        hour = 12
-    if 10 <= hour < 15:
-        later_temp_time = "noon"
-    elif 15 <= hour < 21:
-        later_temp_time = "afternoon"
-    else:
-        later_temp_time = "night"
-    prec_window = precs[idx:later_idx + 1]
-    precipitation = max(prec_window)
+def departures_valid_until(buses, now):
+    # Fewer than DEPARTURES_SHOWN known departures: ask again in a minute,
+    # as a sign without this mode would.
+    if len(buses) < DEPARTURES_SHOWN:
+        return now + 60
+    return min(now + DEPARTURES_VALID_FOR, max(buses[-DEPARTURES_SHOWN]["departure"], now + 60))
 
+def drawn_departures(buses, now, until):
+    # What a sign counting down from now to until shows: every departure
+    # before until, then the DEPARTURES_SHOWN it shows at until. Ones that
+    # have left or lie beyond that are not drawn.
+    upcoming = [bus for bus in buses if bus["departure"] >= now]
+    drawn = [bus for bus in upcoming if bus["departure"] < until]
+    return drawn + upcoming[len(drawn):len(drawn) + DEPARTURES_SHOWN]
+
+def format_reading(value, unit):
+    return "N/A" if isnan(value) else f"{value}{unit}"
+
+def wind_condition(wind_kmh):
     if wind_kmh <= 5:
-        wind_condition = "Calm"
+        return "Calm"
     elif wind_kmh <= 15:
-        wind_condition = "Breeze"
+        return "Breeze"
     elif wind_kmh <= 30:
-        wind_condition = "Fresh breeze"
+        return "Fresh breeze"
     elif wind_kmh <= 60:
-        wind_condition = "Windy"
+        return "Windy"
     elif wind_kmh <= 90:
-        wind_condition = "Gusty"
+        return "Gusty"
     elif wind_kmh <= 120:
-        wind_condition = "Stormy"
-    else:
-        wind_condition = "Twister"
-
-    return {
-        "current_temp": f"{current_temp}°C",
-        "wind_kmh": f"{wind_kmh} km/h",
-        "wind_condition": wind_condition,
-        "later_temp": f"{later_temp}°C",
-        "later_temp_time": later_temp_time,
-        "precipitation": f"{precipitation}%"
-    }
+        return "Stormy"
+    return "Twister"
+
+class WeatherForecast:
+    # The hourly Open-Meteo forecast as flat columns, parsed once per
+    # upstream response. The weather box for every hour slot is worked out
+    # the first time a timezone asks for it, after which a request is one
+    # index computation into that list. Missing readings are NaN and shown
+    # as N/A.
+    def __init__(self, hourly):
+        self.hours = array("q", (t // 3600 for t in hourly["time"]))
+        self.temps = array("d", (float("nan") if v is None else v for v in hourly["temperature_2m"]))
+        self.winds = array("d", (float("nan") if v is None else v for v in hourly["wind_speed_10m"]))
+        self.precs = array("h", (v or 0 for v in hourly["precipitation_probability"]))
+        self.slots = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.hours)
+
+    def at(self, timestamp, tz):
+        with self.lock:
+            slots = self.slots.get(tz)
+            if slots is None:
+                slots = self.slots[tz] = [self._slot(idx, tz) for idx in range(len(self.hours))]
+        # Open-Meteo hours are consecutive, so the slot is an offset.
+        idx = min(max(int(timestamp // 3600) - self.hours[0], 0), len(slots) - 1)
+        return dict(slots[idx])
+
+    def _slot(self, idx, tz):
+        later_idx = min(idx + 4, len(self.temps) - 1)
+        hour = datetime.fromtimestamp(self.hours[later_idx] * 3600, tz).hour
+        if 10 <= hour < 15:
+            later_temp_time = "noon"
+        elif 15 <= hour < 21:
+            later_temp_time = "afternoon"
+        else:
+            later_temp_time = "night"
+        wind = self.winds[idx]
+        return {
+            "current_temp": format_reading(self.temps[idx], "°C"),
+            "wind_kmh": format_reading(wind, " km/h"),
+            "wind_condition": "N/A" if isnan(wind) else wind_condition(wind),
+            "later_temp": format_reading(self.temps[later_idx], "°C"),
+            "later_temp_time": later_temp_time,
+            "precipitation": f"{max(self.precs[idx:later_idx + 1])}%"
+        }
+
+def process_weather(forecast, tz):
+    return forecast.at(time.time(), tz)
 
-def process_next_event(api_response):
+def process_next_event(event_index, tz=None):
     try:
-        event_date_raw = api_response.vobject_instance.vevent.dtstart.value
-        desc = api_response.vobject_instance.vevent.summary.value
+        now = local_now(tz)
+        next_event = event_index.next_event(now)
+        if next_event is None:
+            print("No upcoming events found")
+            return {}
+        desc = next_event.summary
         # Handle escaped unicode (e.g., '\ud83d\udea2')
         if isinstance(desc, str) and '\\u' in desc:
             try:
@@ -204,12 +764,8 @@ def process_next_event(api_response):
             except Exception:
                 pass
         # Format event_date
-        from datetime import datetime, timedelta
-        if isinstance(event_date_raw, datetime):
-            event_date_dt = event_date_raw.date()
-        else:
-            event_date_dt = event_date_raw
-        today = datetime.now().date()
+        event_date_dt = next_event.start.date()
+        today = now.date()
         tomorrow = today + timedelta(days=1)
         if event_date_dt == today:
             event_date = "today"
@@ -234,25 +790,319 @@ def process_next_event(api_response):
     except Exception as e:
         print(f"Next Event processing error: {e}")
         return {}
+def get_frame(mode="1bit", profile=None):
+    # Render with the same draw_* pipeline as main.py and pack the result
+    # exactly as EPD.getbuffer (or getbuffer_4Gray) would on the device.
+    image = display.render(get_display_data(profile))
+    if mode == "4gray":
+        return framebuffer.pack_4gray(image, display.WIDTH, display.HEIGHT)
+    return framebuffer.pack_1bit(image, display.WIDTH, display.HEIGHT)
+
+class FrameHistory:
+    # Recently sent frames by (sign, mode) and version (their SHA-256).
+    def __init__(self, size):
+        self.size = size
+        self.frames = {}
+        self.lock = threading.Lock()
+        self.stats = {"full": 0, "delta": 0, "not_modified": 0, "raw_bytes": 0, "sent_bytes": 0}
+
+    def add(self, key, buf):
+        # Remembers buf as the latest frame for key and returns its version.
+        version = hashlib.sha256(buf).hexdigest()
+        with self.lock:
+            frames = self.frames.setdefault(key, OrderedDict())
+            frames[version] = bytes(buf)
+            frames.move_to_end(version)
+            while len(frames) > self.size:
+                frames.popitem(last=False)
+        return version
+
+    def encode(self, key, buf, base):
+        # (base used or None, RLE body)
+        with self.lock:
+            base_buf = self.frames.get(key, {}).get(base) if base else None
+        if base_buf is not None:
+            body = framebuffer.rle_encode(framebuffer.xor_bytes(buf, base_buf))
+        else:
+            base = None
+            body = framebuffer.rle_encode(buf)
+        with self.lock:
+            self.stats["delta" if base else "full"] += 1
+            self.stats["raw_bytes"] += len(buf)
+            self.stats["sent_bytes"] += len(body)
+        return base, body
+
+FRAMES = FrameHistory(FRAME_HISTORY)
+
+def build_timeline(profile, minutes=TIMELINE_MINUTES):
+    # One fetch, then a frame per minute from the start of the current one;
+    # only the departure countdowns move between frames.
+    data = get_display_data(profile, absolute=True)
+    start = int(time.time()) // 60 * 60
+    frames = []
+    for timestamp in range(start, start + minutes * 60, 60):
+        image = display.render(data, timestamp, profile.tz)
+        frames.append((timestamp, framebuffer.pack_1bit(image, display.WIDTH, display.HEIGHT)))
+    return framebuffer.encode_timeline(frames, display.WIDTH // 8)
+
+class FrameTimeline:
+    # Keeps an encoded timeline ready for one profile. The worker thread
+    # starts with the first request and exits once rebuilds go unrequested,
+    # so profiles nobody asks for cost nothing.
+    def __init__(self, profile):
+        self.profile = profile
+        self.blob = None
+        self.ready = threading.Event()
+        self.lock = threading.Lock()
+        self.worker = None
+        self.last_requested = 0
+        self.stats = {"builds": 0, "errors": 0, "build_ms": 0, "stops": 0}
+
+    def get(self):
+        with self.lock:
+            self.last_requested = time.monotonic()
+            if self.worker is None:
+                self.worker = threading.Thread(target=self._run, daemon=True)
+                self.worker.start()
+        self.ready.wait(DISPLAY_DEADLINE * 2)
+        return self.blob
+
+    def _run(self):
+        idle = 0
+        started = 0
+        while True:
+            with self.lock:
+                idle = 0 if self.last_requested >= started else idle + 1
+                if idle > TIMELINE_IDLE_REBUILDS:
+                    self.worker = None
+                    self.blob = None
+                    self.ready.clear()
+                    self.stats["stops"] += 1
+                    return
+            started = time.monotonic()
+            try:
+                self.blob = build_timeline(self.profile)
+                self.stats["builds"] += 1
+                self.stats["build_ms"] = round((time.monotonic() - started) * 1000)
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"Timeline build error ({self.profile.name}): {e}")
+            self.ready.set()
+            time.sleep(max(TIMELINE_REBUILD - (time.monotonic() - started), 1))
+
+TIMELINES = {profile.name: FrameTimeline(profile) for profile in PROFILES}
+
+def display_etag(data, now=None):
+    # Covers what is drawn only, not meta or valid_until. For absolute
+    # departures that is the ones drawn until valid_until, so a departure
+    # leaving or entering the lookahead window does not change it.
+    content = {key: data[key] for key in ("buses", "weather", "calendar")}
+    if "valid_until" in data:
+        now = int(time.time()) if now is None else now
+        content["buses"] = drawn_departures(data["buses"], now, data["valid_until"])
+    content = json.dumps(content, sort_keys=True)
+    return '"%s"' % hashlib.sha1(content.encode()).hexdigest()[:16]
+
+class DisplayVersions:
+    # The ETag of each sign's absolute-departures /display content and a
+    # version number that goes up only when that ETag changes.
+    def __init__(self):
+        self.changed = threading.Condition()
+        self.current = {}
+        self.watchers = {}
+        self.waiting = 0
+        self.waiters = {}
+        self.last_wait = {}
+
+    def update(self, profile, data):
+        etag = display_etag(data)
+        with self.changed:
+            version, current_etag = self.current.get(profile.name, (0, None))
+            if etag != current_etag:
+                self.current[profile.name] = (version + 1, etag)
+                self.changed.notify_all()
+        return etag
+
+    def get(self, profile):
+        with self.changed:
+            return self.current.get(profile.name, (0, None))
+
+    def wait(self, profile, etag, timeout):
+        # (version, etag) as soon as the content no longer matches etag,
+        # or whatever is current when the timeout runs out. None when too
+        # many requests are already waiting.
+        with self.changed:
+            if self.waiting >= LONGPOLL_MAX:
+                return None
+            if profile.name not in self.watchers:
+                self.watchers[profile.name] = threading.Thread(target=self._watch, args=(profile,), daemon=True)
+                self.watchers[profile.name].start()
+            self.waiting += 1
+            self.waiters[profile.name] = self.waiters.get(profile.name, 0) + 1
+            try:
+                self.changed.wait_for(lambda: self.current.get(profile.name, (0, None))[1] not in (None, etag), timeout)
+                return self.current.get(profile.name, (0, None))
+            finally:
+                self.waiting -= 1
+                self.waiters[profile.name] -= 1
+                self.last_wait[profile.name] = time.monotonic()
+
+    def _watch(self, profile):
+        # Stops once nobody has waited on this sign for a whole interval;
+        # the next wait starts a new watcher.
+        while True:
+            try:
+                self.update(profile, get_display_data(profile, absolute=True))
+            except Exception as e:
+                print(f"Display watch error ({profile.name}): {e}")
+            time.sleep(DISPLAY_WATCH_INTERVAL)
+            with self.changed:
+                if (not self.waiters.get(profile.name)
+                        and time.monotonic() - self.last_wait.get(profile.name, 0) >= DISPLAY_WATCH_INTERVAL):
+                    del self.watchers[profile.name]
+                    return
+
+VERSIONS = DisplayVersions()
+
 class SimpleHandler(BaseHTTPRequestHandler):
-    def _set_headers(self, status=200, content_type="application/json"):
+    protocol_version = "HTTP/1.1"
+    timeout = KEEPALIVE_TIMEOUT
+
+    def _send(self, body, status=200, content_type="application/json", headers=None):
+        if not isinstance(body, (bytes, bytearray)):
+            body = json.dumps(body).encode()
         self.send_response(status)
         self.send_header('Content-type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
         self.end_headers()
+        self.wfile.write(body)
+
+    def _send_display(self, data, etag, headers):
+        headers["ETag"] = etag
+        if etag in (tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")):
+            self.send_response(304)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+        else:
+            self._send(data, headers=headers)
+
+    def _profile(self):
+        scheme, _, token = self.headers.get("Authorization", "").partition(" ")
+        profile = find_profile(token.strip() if scheme.lower() == "bearer" else "")
+        if profile is None:
+            self._send({"error": "Unauthorized"}, status=401, headers={"WWW-Authenticate": "Bearer"})
+        return profile
 
     def do_GET(self):
-        if self.path == "/":
-            self._set_headers()
-            self.wfile.write(json.dumps({"success": True}).encode())
-        elif self.path == "/display":
-            self._set_headers()
-            self.wfile.write(json.dumps(get_display_data()).encode())
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if url.path == "/":
+            self._send({"success": True})
+        elif url.path == "/stats":
+            self._send({
+                "cache": CACHE.snapshot(),
+                "calendar": {profile.name: profile.calendar.stats for profile in PROFILES if profile.calendar},
+                "upstream": UPSTREAM.snapshot(),
+                "timeline": {name: timeline.stats for name, timeline in TIMELINES.items() if timeline.worker},
+                "frames": FRAMES.stats,
+                "display_versions": {name: version for name, (version, _) in VERSIONS.current.items()},
+                "font_errors": display.FONTS.errors,
+            })
+        elif url.path == "/display":
+            profile = self._profile()
+            if profile:
+                absolute = query.get("departures", [""])[0] == "absolute"
+                data = get_display_data(profile, absolute)
+                if absolute:
+                    etag = VERSIONS.update(profile, data)
+                    max_age = max(data["valid_until"] - int(time.time()), 0)
+                    self._send_display(data, etag, {"Cache-Control": f"max-age={max_age}"})
+                else:
+                    self._send_display(data, display_etag(data), {})
+        elif url.path == "/display/wait":
+            profile = self._profile()
+            if profile:
+                etag = query.get("etag", [""])[0]
+                try:
+                    timeout = min(float(query.get("timeout", [LONGPOLL_TIMEOUT])[0]), LONGPOLL_TIMEOUT)
+                except ValueError:
+                    timeout = LONGPOLL_TIMEOUT
+                current = VERSIONS.wait(profile, etag, timeout)
+                if current is None:
+                    self._send({"error": "Too many waiting requests"}, status=503, headers={"Retry-After": "60"})
+                else:
+                    version, current_etag = current
+                    self._send({"version": version, "etag": current_etag, "changed": current_etag not in (None, etag)})
+        elif url.path == "/frame":
+            profile = self._profile()
+            if profile:
+                mode = query.get("mode", ["1bit"])[0]
+                buf = get_frame(mode, profile)
+                if query.get("encoding", [""])[0] != "rle":
+                    self._send(buf, content_type="application/octet-stream")
+                else:
+                    version = FRAMES.add((profile.name, mode), buf)
+                    headers = {"ETag": f'"{version}"', "X-Frame-Version": version}
+                    if f'"{version}"' in self.headers.get("If-None-Match", ""):
+                        with FRAMES.lock:
+                            FRAMES.stats["not_modified"] += 1
+                        self.send_response(304)
+                        for name, value in headers.items():
+                            self.send_header(name, value)
+                        self.end_headers()
+                    else:
+                        base, body = FRAMES.encode((profile.name, mode), buf, query.get("base", [""])[0])
+                        if base:
+                            headers["X-Frame-Base"] = base
+                        self._send(body, content_type="application/x-epd-rle", headers=headers)
+        elif url.path == "/timeline":
+            profile = self._profile()
+            if profile:
+                blob = TIMELINES[profile.name].get()
+                if blob is None:
+                    self._send({"error": "Timeline not ready"}, status=503)
+                else:
+                    self._send(blob, content_type="application/octet-stream")
         else:
-            self._set_headers(404)
-            self.wfile.write(json.dumps({"error": "Not found"}).encode())
+            self._send({"error": "Not found"}, status=404)
+
+class PooledHTTPServer(HTTPServer):
+    # HTTPServer that hands every accepted connection to a bounded pool of
+    # worker threads, so a request waiting on an upstream no longer blocks
+    # the other signs or the health check.
+    def __init__(self, server_address, handler_class, workers):
+        super().__init__(server_address, handler_class)
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        # Stop accepting, then let the requests in flight finish.
+        super().server_close()
+        self.pool.shutdown(wait=True)
 
 if __name__ == "__main__":
     server_address = ('', int(os.getenv("PORT", 3000)))
-    httpd = HTTPServer(server_address, SimpleHandler)
-    print(f"Serving on port {server_address[1]}")
-    httpd.serve_forever()
+    httpd = PooledHTTPServer(server_address, SimpleHandler, SERVER_WORKERS)
+    # shutdown() blocks until serve_forever returns, so it cannot run on
+    # the thread that is serving.
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=httpd.shutdown).start())
+    print(f"Serving on port {server_address[1]} with {SERVER_WORKERS} workers")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
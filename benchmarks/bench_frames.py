@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# Size and speed of the /frame RLE encoding on a realistic 800x480 frame
+# (four departures, weather, calendar) and on the XOR deltas between ten
+# consecutive minute frames, with zlib for comparison.
+#
+#   python benchmarks/bench_frames.py
+
+import os
+import sys
+import time
+import timeit
+import zlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'lib'))
+sys.path.insert(0, ROOT)
+
+from waveshare_epd import framebuffer
+import main as display
+
+NOW = int(time.time()) // 60 * 60
+DATA = {
+    "buses": [
+        {"number": "4", "destination": "Slussen", "departure": NOW + 150},
+        {"number": "55", "destination": "Slussen", "departure": NOW + 420},
+        {"number": "4", "destination": "Slussen", "departure": NOW + 900},
+        {"number": "76", "destination": "Slussen", "departure": NOW + 1500},
+    ],
+    "weather": {
+        "current_temp": "18.0°C",
+        "wind_kmh": "12.0 km/h",
+        "wind_condition": "Breeze",
+        "later_temp": "21.0°C",
+        "later_temp_time": "afternoon",
+        "precipitation": "10%",
+    },
+    "calendar": {"event_date": "today", "event_desc_1": "Dentist 14:30", "event_desc_2": ""},
+    "tz": "Europe/Stockholm",
+}
+
+
+def best_ms(function, number=20):
+    return min(timeit.repeat(function, number=number, repeat=5)) / number * 1000
+
+
+def main():
+    frames = [bytes(framebuffer.pack_1bit(display.render(DATA, NOW + 60 * i), display.WIDTH, display.HEIGHT))
+              for i in range(10)]
+    buf = bytearray(len(frames[0]))
+
+    full = framebuffer.rle_encode(frames[0])
+    print(f"full frame: {len(frames[0])} B raw -> {len(full)} B RLE; "
+          f"encode {best_ms(lambda: framebuffer.rle_encode(frames[0])):.2f} ms, "
+          f"decode {best_ms(lambda: framebuffer.rle_decode_into(buf, full)):.2f} ms")
+
+    sizes, encode, decode = [], [], []
+    for old, new in zip(frames, frames[1:]):
+        delta = framebuffer.rle_encode(framebuffer.xor_bytes(new, old))
+        sizes.append(len(delta))
+        encode.append(best_ms(lambda: framebuffer.rle_encode(framebuffer.xor_bytes(new, old))))
+        buf[:] = old
+        decode.append(best_ms(lambda: framebuffer.rle_decode_into(buf, delta, xor=True), number=1))
+    print(f"minute deltas: {min(sizes)}-{max(sizes)} B; "
+          f"encode {max(encode):.2f} ms, decode {max(decode):.2f} ms (slowest)")
+
+    compressed = zlib.compress(frames[0], 6)
+    print(f"zlib-6 full frame: {len(compressed)} B; "
+          f"compress {best_ms(lambda: zlib.compress(frames[0], 6)):.2f} ms, "
+          f"decompress {best_ms(lambda: zlib.decompress(compressed)):.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
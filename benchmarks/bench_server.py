@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# Throughput of api-server's PooledHTTPServer against the plain
+# single-threaded HTTPServer, with get_display_data replaced by a stub
+# that sleeps like a slow upstream. Clients alternate /display and /.
+#
+#   python benchmarks/bench_server.py [--upstream-ms 200] [--clients 8] [--requests 5]
+
+import argparse
+import importlib.util
+import os
+import statistics
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import HTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'lib'))
+sys.path.insert(0, ROOT)
+os.environ["API_KEY"] = ""
+os.environ["DEVICES_FILE"] = ""
+
+
+def load_api_server():
+    spec = importlib.util.spec_from_file_location("api_server", os.path.join(ROOT, "api-server.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def run(server, clients, requests):
+    port = server.server_address[1]
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    def client(n):
+        latencies = []
+        for i in range(requests):
+            path = "/display" if (n + i) % 2 == 0 else "/"
+            start = time.perf_counter()
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=60) as response:
+                response.read()
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(clients) as pool:
+        latencies = [lat for result in pool.map(client, range(clients)) for lat in result]
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+    server.server_close()
+    return len(latencies) / elapsed, statistics.median(latencies), max(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--upstream-ms", type=float, default=200)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    api = load_api_server()
+
+    def slow_display_data(profile=None, absolute=False):
+        time.sleep(args.upstream_ms / 1000)
+        return {"buses": [], "weather": {}, "calendar": {}, "meta": {}}
+
+    api.get_display_data = slow_display_data
+    api.SimpleHandler.log_message = lambda *a: None
+    servers = [
+        ("HTTPServer", lambda: HTTPServer(("127.0.0.1", 0), api.SimpleHandler)),
+        (f"PooledHTTPServer ({args.workers})", lambda: api.PooledHTTPServer(("127.0.0.1", 0), api.SimpleHandler, args.workers)),
+    ]
+    print(f"{args.upstream_ms:.0f} ms upstream, {args.clients} clients x {args.requests} requests")
+    for name, make in servers:
+        rate, p50, worst = run(make(), args.clients, args.requests)
+        print(f"  {name:22s} {rate:6.1f} req/s  p50 {p50 * 1000:5.0f} ms  max {worst * 1000:5.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# Startup cost of main.py: a fresh process imports main and renders one
+# frame, with the full fonts and with the `main.py --subset-fonts` subsets
+# (needs fonttools). --before <git rev> adds that revision of the tree,
+# which needs to have main.render.
+# Prints the median over --runs runs after one warm-up run, which builds
+# the glyph atlases.
+#
+# MaterialSymbolsOutlined.ttf is not shipped. Code from before the font
+# registry falls back to the default font for every font when one is
+# missing, so put the icon font (or a stand-in copy of another font) in
+# lib/fonts for a fair --before comparison.
+#
+#   python benchmarks/bench_startup.py [--runs 15] [--before <rev>]
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+CHILD = r'''
+import json, os, resource, sys, time, types
+sys.path.insert(0, os.path.join(os.environ["PKG"], "lib"))
+sys.path.insert(0, os.environ["PKG"])
+if os.environ.get("FAKE_EPDCONFIG"):
+    # Older trees pick the hardware when epdconfig is imported.
+    import waveshare_epd
+    fake = types.ModuleType("waveshare_epd.epdconfig")
+    fake.RST_PIN, fake.DC_PIN, fake.CS_PIN, fake.BUSY_PIN = 17, 25, 8, 24
+    sys.modules["waveshare_epd.epdconfig"] = waveshare_epd.epdconfig = fake
+now = int(time.time())
+sample = {
+    "buses": [{"number": "53", "destination": "Slussen", "departure": now + 130},
+              {"number": "176X", "destination": "Södermalm", "departure": now + 400}],
+    "weather": {"current_temp": "12.5°C", "wind_kmh": "8.3 km/h", "wind_condition": "Fresh breeze",
+                "later_temp": "-3.0°C", "later_temp_time": "noon", "precipitation": "20%"},
+    "calendar": {"event_date": "today", "event_desc_1": "Dentist 🦷 at 3", "event_desc_2": ""},
+}
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+main.render(sample)
+rendered = time.perf_counter()
+print(json.dumps([imported - started, rendered - imported, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss]))
+'''
+
+
+def run(env):
+    out = subprocess.run([sys.executable, "-c", CHILD], capture_output=True, text=True, cwd=tempfile.gettempdir(),
+                         env={**os.environ, **env}, check=True)
+    return json.loads(out.stdout.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=15)
+    parser.add_argument("--before", help="git revision to compare against")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        subsets = os.path.join(tmp, "subset")
+        subprocess.run([sys.executable, os.path.join(ROOT, "main.py"), "--subset-fonts"], check=True,
+                       env={**os.environ, "FONT_SUBSET_DIR": subsets})
+        configs = {}
+        if args.before:
+            before = os.path.join(tmp, "before")
+            os.makedirs(before)
+            archive = subprocess.run(["git", "-C", ROOT, "archive", args.before], check=True, capture_output=True)
+            subprocess.run(["tar", "-x", "-C", before], input=archive.stdout, check=True)
+            shutil.rmtree(os.path.join(before, "lib", "fonts"), ignore_errors=True)
+            shutil.copytree(os.path.join(ROOT, "lib", "fonts"), os.path.join(before, "lib", "fonts"),
+                            ignore=shutil.ignore_patterns("subset"))
+            configs[f"before ({args.before})"] = {"PKG": before, "FAKE_EPDCONFIG": "1"}
+        configs["full fonts"] = {"PKG": ROOT, "FONT_SUBSET_DIR": os.path.join(tmp, "none")}
+        configs["subset fonts"] = {"PKG": ROOT, "FONT_SUBSET_DIR": subsets}
+
+        results = {name: [] for name in configs}
+        for i in range(args.runs + 1):
+            for name, env in configs.items():
+                # Own atlas directory per config, so they don't rebuild each other's.
+                atlas = os.path.join(tmp, "atlas-" + str(list(configs).index(name)))
+                row = run({**env, "GLYPH_ATLAS_DIR": atlas})
+                if i:
+                    results[name].append(row)
+
+    for name, rows in results.items():
+        median = lambda j: statistics.median(row[j] for row in rows)
+        print(f"{name:24s} import {median(0) * 1000:6.1f} ms  first render {median(1) * 1000:6.1f} ms  "
+              f"maxrss {median(2) / 1024:5.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -29,7 +29,9 @@
 
 
 import logging
+import time
 from . import epdconfig
+from . import framebuffer
 
 # Display resolution
 EPD_WIDTH       = 800
@@ -40,10 +42,47 @@ GRAY2  = 0xC0
 GRAY3  = 0x80 #gray
 GRAY4  = 0x00 #Blackest
 
+# Longest a single busy period may last before ReadBusy gives up (seconds)
+BUSY_TIMEOUT = 15
+
+# Names for the busy periods recorded by ReadBusy. 0x20 runs whatever
+# sequence the preceding 0x22 (Display Update Control) selected.
+BUSY_COMMANDS = {0x12: "SWRESET"}
+UPDATE_SEQUENCES = {
+    0x91: "temperature load",
+    0xF7: "full update",
+    0xC7: "fast update",
+    0xFF: "partial update",
+}
+
+# Register setup shared by init, init_Fast and init_4GRAY, sent as one
+# (command, parameter bytes) pair per register.
+INIT_SEQUENCE = [
+    (0x18, [0x80]),                                          # use the internal temperature sensor
+    (0x0C, [0xAE, 0xC7, 0xC3, 0xC0, 0x80]),                  # set soft start
+    (0x01, [(EPD_HEIGHT-1)%256, (EPD_HEIGHT-1)//256, 0x02]), # drive output control
+    (0x3C, [0x01]),                                          # Border setting
+    (0x11, [0x01]),                                          # data entry mode X-mode x+ y-
+]
+
+# Load the temperature table for the fast waveform (about 1.5s busy).
+FAST_TEMP_SEQUENCE = [
+    (0x1A, [0x5A]),
+    (0x22, [0x91]),
+    (0x20, []),
+]
+
+PARTIAL_SEQUENCE = [
+    (0x18, [0x80]),                                    # BorderWavefrom
+    (0x3C, [0x80]),                                    # BorderWavefrom
+    (0x01, [(EPD_HEIGHT-1)%256, (EPD_HEIGHT-1)//256]), # drive output control
+    (0x11, [0x01]),                                    # data entry mode X-mode x+ y-
+]
+
 logger = logging.getLogger(__name__)
 
 class EPD:
-    def __init__(self):
+    def __init__(self, busy_timeout=BUSY_TIMEOUT):
         self.reset_pin = epdconfig.RST_PIN
         self.dc_pin = epdconfig.DC_PIN
         self.busy_pin = epdconfig.BUSY_PIN
@@ -54,6 +93,10 @@ class EPD:
         self.GRAY2  = GRAY2
         self.GRAY3  = GRAY3 #gray
         self.GRAY4  = GRAY4 #Blackest
+        self.busy_timeout = busy_timeout
+        self.busy_cause = None
+        self.update_control = None
+        self.stats = {"spi_transactions": 0, "gpio_writes": 0, "busy": []}
 
     LUT_DATA_4Gray =  [#  #112bytes										
         0x80,	0x48,	0x4A,	0x22,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,	
@@ -75,64 +118,111 @@ class EPD:
         0x17,	0x41,	0xA8,	0x32,	0x30,						
         0x00,	0x00	]
     
+    # Register writes that follow the waveform LUT: 0x32 takes the first
+    # 105 bytes, then VGH, VSH1/VSH2/VSL and VCOM.
+    LUT_SEQUENCE = [
+        (0x32, LUT_DATA_4Gray[0:105]),
+        (0x03, LUT_DATA_4Gray[105:106]), #VGH
+        (0x04, LUT_DATA_4Gray[106:109]), #VSH1 VSH2 VSL
+        (0x2C, LUT_DATA_4Gray[109:110]), #VCOM Voltage
+    ]
+
+    '''
+    function : Return the SPI/GPIO counters and the (cause, seconds) busy
+               periods collected since the last call and start counting
+               again, e.g. once per refresh
+    '''
+    def reset_stats(self):
+        stats = self.stats
+        self.stats = {"spi_transactions": 0, "gpio_writes": 0, "busy": []}
+        return stats
+
+    def _digital_write(self, pin, value):
+        self.stats["gpio_writes"] += 1
+        epdconfig.digital_write(pin, value)
+
+    def _spi_write(self, data):
+        self.stats["spi_transactions"] += 1
+        epdconfig.spi_writebyte2(data)
+
     # Hardware reset
     def reset(self):
-        epdconfig.digital_write(self.reset_pin, 1)
+        self.busy_cause = "RESET"
+        self._digital_write(self.reset_pin, 1)
         epdconfig.delay_ms(20) 
-        epdconfig.digital_write(self.reset_pin, 0)
+        self._digital_write(self.reset_pin, 0)
         epdconfig.delay_ms(2)
-        epdconfig.digital_write(self.reset_pin, 1)
+        self._digital_write(self.reset_pin, 1)
         epdconfig.delay_ms(20)   
 
     def send_command(self, command):
-        epdconfig.digital_write(self.dc_pin, 0)
-        epdconfig.digital_write(self.cs_pin, 0)
-        epdconfig.spi_writebyte([command])
-        epdconfig.digital_write(self.cs_pin, 1)
+        self.command(command)
 
     def send_data(self, data):
-        epdconfig.digital_write(self.dc_pin, 1)
-        epdconfig.digital_write(self.cs_pin, 0)
-        epdconfig.spi_writebyte([data])
-        epdconfig.digital_write(self.cs_pin, 1)
+        self._digital_write(self.dc_pin, 1)
+        self._digital_write(self.cs_pin, 0)
+        self._spi_write([data])
+        self._digital_write(self.cs_pin, 1)
 
     def send_data2(self, data):
-        epdconfig.digital_write(self.dc_pin, 1)
-        epdconfig.digital_write(self.cs_pin, 0)
-        epdconfig.SPI.writebytes2(data)
-        epdconfig.digital_write(self.cs_pin, 1)
+        self._digital_write(self.dc_pin, 1)
+        self._digital_write(self.cs_pin, 0)
+        self._spi_write(data)
+        self._digital_write(self.cs_pin, 1)
+
+    '''
+    function : Send a command followed by all of its parameter bytes with
+               a single DC switch and one bulk SPI write
+    parameter:
+        cmd : command byte
+        data : parameter bytes (list, bytes or bytearray)
+    '''
+    def command(self, cmd, data=b''):
+        if cmd == 0x22 and len(data):
+            self.update_control = data[0]
+        if cmd == 0x20:
+            self.busy_cause = UPDATE_SEQUENCES.get(self.update_control, "update 0x%02X" % (self.update_control or 0))
+        else:
+            self.busy_cause = BUSY_COMMANDS.get(cmd, "0x%02X" % cmd)
+        self._digital_write(self.dc_pin, 0)
+        self._digital_write(self.cs_pin, 0)
+        self._spi_write([cmd])
+        if len(data):
+            self._digital_write(self.dc_pin, 1)
+            self._spi_write(data)
+        self._digital_write(self.cs_pin, 1)
+
+    def send_sequence(self, sequence):
+        for cmd, data in sequence:
+            self.command(cmd, data)
 
     def ReadBusy(self):
         logger.debug("e-Paper busy")
-        busy = epdconfig.digital_read(self.busy_pin)
-        while(busy == 1):
-            busy = epdconfig.digital_read(self.busy_pin)
-            epdconfig.delay_ms(20)
-        epdconfig.delay_ms(20)
-        logger.debug("e-Paper busy release")
+        start = time.monotonic()
+        if not epdconfig.wait_busy_release(self.busy_timeout):
+            logger.warning("e-Paper still busy after %ss (%s)", self.busy_timeout, self.busy_cause)
+        elapsed = time.monotonic() - start
+        self.stats["busy"].append((self.busy_cause, elapsed))
+        logger.debug("e-Paper busy release after %.3fs (%s)", elapsed, self.busy_cause)
 
     def TurnOnDisplay(self):
-        self.send_command(0x22) #Display Update Control
-        self.send_data(0xF7)
-        self.send_command(0x20) #Activate Display Update Sequence
+        self.command(0x22, [0xF7]) #Display Update Control
+        self.command(0x20) #Activate Display Update Sequence
         self.ReadBusy()
 
     def TurnOnDisplay_Fast(self):
-        self.send_command(0x22) #Display Update Control
-        self.send_data(0xC7)
-        self.send_command(0x20) #Activate Display Update Sequence
+        self.command(0x22, [0xC7]) #Display Update Control
+        self.command(0x20) #Activate Display Update Sequence
         self.ReadBusy()
 
     def TurnOnDisplay_Part(self):
-        self.send_command(0x22) #Display Update Control
-        self.send_data(0xFF)
-        self.send_command(0x20) #Activate Display Update Sequence
+        self.command(0x22, [0xFF]) #Display Update Control
+        self.command(0x20) #Activate Display Update Sequence
         self.ReadBusy()
 
     def TurnOnDisplay_4GRAY(self):
-        self.send_command(0x22) #Display Update Control
-        self.send_data(0xC7)
-        self.send_command(0x20) #Activate Display Update Sequence
+        self.command(0x22, [0xC7]) #Display Update Control
+        self.command(0x20) #Activate Display Update Sequence
         self.ReadBusy()
 
     '''
@@ -144,17 +234,10 @@ class EPD:
         yend : End position of Y-axis
     '''
     def SetWindow(self, x_start, y_start, x_end, y_end):
-        self.send_command(0x44) # SET_RAM_X_ADDRESS_START_END_POSITION
-        self.send_data(x_start & 0xFF)
-        self.send_data((x_start>>8) & 0x03)
-        self.send_data(x_end & 0xFF)
-        self.send_data((x_end>>8) & 0x03)
-        
-        self.send_command(0x45) # SET_RAM_Y_ADDRESS_START_END_POSITION
-        self.send_data(y_start & 0xFF)
-        self.send_data((y_start >> 8) & 0xFF)
-        self.send_data(y_end & 0xFF)
-        self.send_data((y_end >> 8) & 0xFF)
+        # SET_RAM_X_ADDRESS_START_END_POSITION
+        self.command(0x44, [x_start & 0xFF, (x_start>>8) & 0x03, x_end & 0xFF, (x_end>>8) & 0x03])
+        # SET_RAM_Y_ADDRESS_START_END_POSITION
+        self.command(0x45, [y_start & 0xFF, (y_start >> 8) & 0xFF, y_end & 0xFF, (y_end >> 8) & 0xFF])
 
     '''
     function : Set Cursor
@@ -163,14 +246,11 @@ class EPD:
         y : Y-axis starting position
     '''
     def SetCursor(self, x, y):
-        self.send_command(0x4E) # SET_RAM_X_ADDRESS_COUNTER
+        # SET_RAM_X_ADDRESS_COUNTER
         # x point must be the multiple of 8 or the last 3 bits will be ignored
-        self.send_data(x & 0xFF)
-        self.send_data((x>>8) & 0x03)
-        
-        self.send_command(0x4F) # SET_RAM_Y_ADDRESS_COUNTER
-        self.send_data(y & 0xFF)
-        self.send_data((y >> 8) & 0xFF)
+        self.command(0x4E, [x & 0xFF, (x>>8) & 0x03])
+        # SET_RAM_Y_ADDRESS_COUNTER
+        self.command(0x4F, [y & 0xFF, (y >> 8) & 0xFF])
         
     def init(self):
         if (epdconfig.module_init() != 0):
@@ -179,29 +259,10 @@ class EPD:
         self.reset()
         self.ReadBusy()
 
-        self.send_command(0x12) #SWRESET
+        self.command(0x12) #SWRESET
         self.ReadBusy()
 
-        self.send_command(0x18) # use the internal temperature sensor
-        self.send_data(0x80)
-
-        self.send_command(0x0C) #set soft start     
-        self.send_data(0xAE)
-        self.send_data(0xC7)
-        self.send_data(0xC3)
-        self.send_data(0xC0)
-        self.send_data(0x80)
-
-        self.send_command(0x01)   #      drive output control    
-        self.send_data((self.height-1)%256) #  Y  
-        self.send_data((self.height-1)//256) #  Y 
-        self.send_data(0x02)
-
-        self.send_command(0x3C)        # Border       Border setting 
-        self.send_data(0x01)
-
-        self.send_command(0x11)        #    data  entry  mode
-        self.send_data(0x01)           #       X-mode  x+ y-    
+        self.send_sequence(INIT_SEQUENCE)
 
         self.SetWindow(0, self.height-1, self.width-1, 0)
 
@@ -218,29 +279,10 @@ class EPD:
         self.reset()
         self.ReadBusy()
 
-        self.send_command(0x12) #SWRESET
+        self.command(0x12) #SWRESET
         self.ReadBusy()
         
-        self.send_command(0x18) # use the internal temperature sensor
-        self.send_data(0x80)
-
-        self.send_command(0x0C) #set soft start     
-        self.send_data(0xAE)
-        self.send_data(0xC7)
-        self.send_data(0xC3)
-        self.send_data(0xC0)
-        self.send_data(0x80)
-
-        self.send_command(0x01)   #      drive output control    
-        self.send_data((self.height-1)%256) #  Y  
-        self.send_data((self.height-1)//256) #  Y 
-        self.send_data(0x02)
-
-        self.send_command(0x3C)        # Border       Border setting 
-        self.send_data(0x01)
-
-        self.send_command(0x11)        #    data  entry  mode
-        self.send_data(0x01)           #       X-mode  x+ y-    
+        self.send_sequence(INIT_SEQUENCE)
 
         self.SetWindow(0, self.height-1, self.width-1, 0)
 
@@ -248,12 +290,7 @@ class EPD:
         self.ReadBusy()
 
         #TEMP (1.5s)
-        self.send_command(0x1A)  
-        self.send_data(0x5A) 
-
-        self.send_command(0x22)  
-        self.send_data(0x91) 
-        self.send_command(0x20) 
+        self.send_sequence(FAST_TEMP_SEQUENCE)
         
         self.ReadBusy()
 
@@ -261,20 +298,7 @@ class EPD:
         return 0
 
     def Lut(self):
-        self.send_command(0x32)
-        for count in range(0, 105):
-            self.send_data(self.LUT_DATA_4Gray[count])
-
-        self.send_command(0x03) #VGH      
-        self.send_data(self.LUT_DATA_4Gray[105])
-
-        self.send_command(0x04) #      
-        self.send_data(self.LUT_DATA_4Gray[106]) #VSH1   
-        self.send_data(self.LUT_DATA_4Gray[107]) #VSH2   
-        self.send_data(self.LUT_DATA_4Gray[108]) #VSL   
-
-        self.send_command(0x2C)     #VCOM Voltage
-        self.send_data(self.LUT_DATA_4Gray[109])    #0x1C
+        self.send_sequence(self.LUT_SEQUENCE)
 
     def init_4GRAY(self):
         if (epdconfig.module_init() != 0):
@@ -283,29 +307,10 @@ class EPD:
         self.reset()
         self.ReadBusy()
 
-        self.send_command(0x12) #SWRESET
+        self.command(0x12) #SWRESET
         self.ReadBusy()
         
-        self.send_command(0x18) # use the internal temperature sensor
-        self.send_data(0x80)
-
-        self.send_command(0x0C) #set soft start     
-        self.send_data(0xAE)
-        self.send_data(0xC7)
-        self.send_data(0xC3)
-        self.send_data(0xC0)
-        self.send_data(0x80)
-
-        self.send_command(0x01)   #      drive output control    
-        self.send_data((self.height-1)%256) #  Y  
-        self.send_data((self.height-1)//256) #  Y 
-        self.send_data(0x02)
-
-        self.send_command(0x3C)        # Border       Border setting 
-        self.send_data(0x01)
-
-        self.send_command(0x11)        #    data  entry  mode
-        self.send_data(0x01)           #       X-mode  x+ y-    
+        self.send_sequence(INIT_SEQUENCE)
 
         self.SetWindow(0, self.height-1, self.width-1, 0)
 
@@ -318,64 +323,10 @@ class EPD:
 
 
     def getbuffer(self, image):
-        # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width / 8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        # logger.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if imwidth == self.width and imheight == self.height:
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif imwidth == self.height and imheight == self.width:
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy * self.width) / 8)] &= ~(0x80 >> (y % 8))
-        return buf
+        return framebuffer.pack_1bit(image, self.width, self.height)
     
     def getbuffer_4Gray(self, image):
-        # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width / 4) * self.height)
-        image_monocolor = image.convert('L')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        i=0
-        # logger.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if(imwidth == self.width and imheight == self.height):
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if(pixels[x, y] == 0xC0):
-                        pixels[x, y] = 0x80
-                    elif (pixels[x, y] == 0x80):
-                        pixels[x, y] = 0x40
-                    i= i+1
-                    if(i%4 == 0):
-                        buf[int((x + (y * self.width))/4)] = ((pixels[x-3, y]&0xc0) | (pixels[x-2, y]&0xc0)>>2 | (pixels[x-1, y]&0xc0)>>4 | (pixels[x, y]&0xc0)>>6)
-                        
-        elif(imwidth == self.height and imheight == self.width):
-            logger.debug("Horizontal")
-            for x in range(imwidth):
-                for y in range(imheight):
-                    newx = y
-                    newy = self.height - x - 1
-                    if(pixels[x, y] == 0xC0):
-                        pixels[x, y] = 0x80
-                    elif (pixels[x, y] == 0x80):
-                        pixels[x, y] = 0x40
-                    i= i+1
-                    if(i%4 == 0):
-                        buf[int((newx + (newy * self.width))/4)] = ((pixels[x, y-3]&0xc0) | (pixels[x, y-2]&0xc0)>>2 | (pixels[x, y-1]&0xc0)>>4 | (pixels[x, y]&0xc0)>>6) 
-        return buf
+        return framebuffer.pack_4gray(image, self.width, self.height)
 
     def display(self, image):
         self.send_command(0x24)
@@ -398,98 +349,78 @@ class EPD:
 
         self.TurnOnDisplay_Fast()
 
+    def display_Base_Fast(self, image):
+        self.command(0x24, image)
+        self.command(0x26, image)
+
+        self.TurnOnDisplay_Fast()
+
     def display_Partial(self, Image):
         
         # Reset
         self.reset()
 
-        self.send_command(0x18) #BorderWavefrom
-        self.send_data(0x80)
+        self.send_sequence(PARTIAL_SEQUENCE)
 
-        self.send_command(0x3C) #BorderWavefrom
-        self.send_data(0x80)
+        self.SetWindow(0, self.height-1, self.width-1, 0)
 
-        self.send_command(0x01)   #      drive output control    
-        self.send_data((self.height-1)%256) #  Y  
-        self.send_data((self.height-1)//256) #  Y 
+        self.SetCursor(0, 0)
 
-        self.send_command(0x11)        #    data  entry  mode
-        self.send_data(0x01)           #       X-mode  x+ y-    
+        self.command(0x24, Image)   #Write Black and White image to RAM
 
-        self.SetWindow(0, self.height-1, self.width-1, 0)
+        self.TurnOnDisplay_Part()
 
-        self.SetCursor(0, 0)
+    '''
+    function : Partial refresh of byte-aligned rectangles only. Both RAM
+               planes must already hold `previous`, e.g. after
+               display_Base_Fast or an earlier call of this method.
+    parameter:
+        image : new frame from getbuffer
+        previous : frame currently shown, from getbuffer
+        windows : (x_start, y_start, x_end, y_end) inclusive pixel
+                  rectangles, x_start and x_end + 1 multiples of 8
+    '''
+    def display_Partial_Windows(self, image, previous, windows):
+        self.reset()
+
+        self.send_sequence(PARTIAL_SEQUENCE)
 
-        self.send_command(0x24)   #Write Black and White image to RAM
-        self.send_data2(Image)
+        for window in windows:
+            self.write_window(0x26, previous, *window)
+            self.write_window(0x24, image, *window)
 
         self.TurnOnDisplay_Part()
 
+        # Bring the "previous" plane up to date so the next partial refresh
+        # only drives its own windows.
+        for window in windows:
+            self.write_window(0x26, image, *window)
+
+    def write_window(self, ram, image, x_start, y_start, x_end, y_end):
+        # Full frames are written from RAM row 0 with the Y counter
+        # decrementing and wrapping to height-1, so image row y lives in RAM
+        # row (-y) % height and row 0 cannot share a window with the rows
+        # below it.
+        if y_start == 0 and y_end > 0:
+            self.write_window(ram, image, x_start, 0, x_end, 0)
+            y_start = 1
+        row_bytes = self.width // 8
+        first, last = x_start // 8, x_end // 8 + 1
+        data = b''.join(bytes(image[y * row_bytes + first:y * row_bytes + last]) for y in range(y_start, y_end + 1))
+
+        self.SetWindow(x_start, (-y_start) % self.height, x_end, (-y_end) % self.height)
+        self.SetCursor(x_start, (-y_start) % self.height)
+        self.command(ram, data)
+
     def display_4Gray(self, image):
+        plane_0x24, plane_0x26 = framebuffer.gray_planes(image)
+
         self.send_command(0x24)
-        for i in range(0, 48000):                     #5808*4  46464
-            temp3=0
-            for j in range(0, 2):
-                temp1 = image[i*2+j]
-                for k in range(0, 2):
-                    temp2 = temp1&0xC0 
-                    if(temp2 == 0xC0):
-                        temp3 |= 0x00
-                    elif(temp2 == 0x00):
-                        temp3 |= 0x01  
-                    elif(temp2 == 0x80): 
-                        temp3 |= 0x01 
-                    else: #0x40
-                        temp3 |= 0x00 
-                    temp3 <<= 1	
-                    
-                    temp1 <<= 2
-                    temp2 = temp1&0xC0 
-                    if(temp2 == 0xC0): 
-                        temp3 |= 0x00
-                    elif(temp2 == 0x00): 
-                        temp3 |= 0x01
-                    elif(temp2 == 0x80):
-                        temp3 |= 0x01
-                    else :   #0x40
-                        temp3 |= 0x00	
-                    if(j!=1 or k!=1):				
-                        temp3 <<= 1
-                    temp1 <<= 2
-            self.send_data(temp3)
-            
-        self.send_command(0x26)	       
-        for i in range(0, 48000):                #5808*4  46464
-            temp3=0
-            for j in range(0, 2):
-                temp1 = image[i*2+j]
-                for k in range(0, 2):
-                    temp2 = temp1&0xC0 
-                    if(temp2 == 0xC0):
-                        temp3 |= 0x00
-                    elif(temp2 == 0x00):
-                        temp3 |= 0x01
-                    elif(temp2 == 0x80):
-                        temp3 |= 0x00
-                    else: #0x40
-                        temp3 |= 0x01 
-                    temp3 <<= 1	
-                    
-                    temp1 <<= 2
-                    temp2 = temp1&0xC0 
-                    if(temp2 == 0xC0): 
-                        temp3 |= 0x00
-                    elif(temp2 == 0x00): 
-                        temp3 |= 0x01
-                    elif(temp2 == 0x80):
-                        temp3 |= 0x00 
-                    else:    #0x40
-                            temp3 |= 0x01	
-                    if(j!=1 or k!=1):					
-                        temp3 <<= 1
-                    temp1 <<= 2
-            self.send_data(temp3)
-        
+        self.send_data2(plane_0x24)
+
+        self.send_command(0x26)
+        self.send_data2(plane_0x26)
+
         self.TurnOnDisplay_4GRAY()
 
     def Clear(self):
@@ -502,8 +433,8 @@ class EPD:
         self.TurnOnDisplay()
 
     def sleep(self):
-        self.send_command(0x10) # DEEP_SLEEP
-        self.send_data(0x01)
+        self.command(0x10, [0x01]) # DEEP_SLEEP
+        logger.debug("SPI/GPIO since last reset_stats: %s", self.stats)
         
         epdconfig.delay_ms(2000)
         epdconfig.module_exit()
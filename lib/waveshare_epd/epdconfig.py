@@ -29,9 +29,10 @@
 
 import os
 import logging
+import struct
 import sys
+import threading
 import time
-import subprocess
 
 from ctypes import *
 
@@ -47,6 +48,8 @@ class RaspberryPi:
     PWR_PIN  = 18
     MOSI_PIN = 10
     SCLK_PIN = 11
+    Flag     = 0
+    BUSY_POLL = 0.01  # seconds between BUSY reads while the edge event lags
 
     def __init__(self):
         import spidev
@@ -98,6 +101,21 @@ class RaspberryPi:
     def delay_ms(self, delaytime):
         time.sleep(delaytime / 1000.0)
 
+    def wait_busy_release(self, timeout=None):
+        # BUSY is a pull-down Button, so it is "released" once the panel
+        # drives the line low. gpiozero's released event is only updated
+        # by its edge callback thread, which right after a command may not
+        # have seen the rising edge yet, so the pin level decides: block
+        # on the edge while the event agrees, poll while it is stale.
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.GPIO_BUSY_PIN.value:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            if self.GPIO_BUSY_PIN.wait_for_release(remaining) and self.GPIO_BUSY_PIN.value:
+                time.sleep(self.BUSY_POLL if remaining is None else min(self.BUSY_POLL, remaining))
+        return True
+
     def spi_writebyte(self, data):
         self.SPI.writebytes(data)
 
@@ -123,9 +141,10 @@ class RaspberryPi:
                 '/usr/lib',
             ]
             self.DEV_SPI = None
+            # The library has to match this interpreter, not the kernel.
+            val = struct.calcsize("P") * 8
+            logging.debug("System is %d bit"%val)
             for find_dir in find_dirs:
-                val = int(os.popen('getconf LONG_BIT').read())
-                logging.debug("System is %d bit"%val)
                 if val == 64:
                     so_filename = os.path.join(find_dir, 'DEV_Config_64.so')
                 else:
@@ -134,11 +153,14 @@ class RaspberryPi:
                     self.DEV_SPI = CDLL(so_filename)
                     break
             if self.DEV_SPI is None:
-                RuntimeError('Cannot find DEV_Config.so')
+                raise RuntimeError('Cannot find DEV_Config.so')
 
             self.DEV_SPI.DEV_Module_Init()
 
-        else:
+        elif self.Flag == 0:
+            # Re-initializing a panel that is still awake must not open the
+            # SPI device a second time.
+            self.Flag = 1
             # SPI device, bus = 0, device = 0
             self.SPI.open(0, 0)
             self.SPI.max_speed_hz = 4000000
@@ -148,6 +170,7 @@ class RaspberryPi:
     def module_exit(self, cleanup=False):
         logger.debug("spi end")
         self.SPI.close()
+        self.Flag = 0
 
         self.GPIO_RST_PIN.off()
         self.GPIO_DC_PIN.off()
@@ -201,6 +224,14 @@ class JetsonNano:
     def delay_ms(self, delaytime):
         time.sleep(delaytime / 1000.0)
 
+    def wait_busy_release(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.digital_read(self.BUSY_PIN) == 1:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            self.delay_ms(10)
+        return True
+
     def spi_writebyte(self, data):
         self.SPI.SYSFS_software_spi_transfer(data[0])
 
@@ -259,6 +290,14 @@ class SunriseX3:
     def delay_ms(self, delaytime):
         time.sleep(delaytime / 1000.0)
 
+    def wait_busy_release(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.digital_read(self.BUSY_PIN) == 1:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            self.delay_ms(10)
+        return True
+
     def spi_writebyte(self, data):
         self.SPI.writebytes(data)
 
@@ -301,22 +340,84 @@ class SunriseX3:
         self.GPIO.cleanup([self.RST_PIN, self.DC_PIN, self.CS_PIN, self.BUSY_PIN], self.PWR_PIN)
 
 
-if sys.version_info[0] == 2:
-    process = subprocess.Popen("cat /proc/cpuinfo | grep Raspberry", shell=True, stdout=subprocess.PIPE)
-else:
-    process = subprocess.Popen("cat /proc/cpuinfo | grep Raspberry", shell=True, stdout=subprocess.PIPE, text=True)
-output, _ = process.communicate()
-if sys.version_info[0] == 2:
-    output = output.decode(sys.stdout.encoding)
-
-if "Raspberry" in output:
-    implementation = RaspberryPi()
-elif os.path.exists('/sys/bus/platform/drivers/gpio-x3'):
-    implementation = SunriseX3()
-else:
-    implementation = JetsonNano()
-
-for func in [x for x in dir(implementation) if not x.startswith('_')]:
-    setattr(sys.modules[__name__], func, getattr(implementation, func))
+BACKENDS = {
+    "raspberrypi": RaspberryPi,
+    "sunrisex3": SunriseX3,
+    "jetsonnano": JetsonNano,
+}
+
+_backend = None
+_implementation = None
+_lock = threading.Lock()
+
+
+def _platform():
+    return os.environ.get("EPD_PLATFORM", "").strip().lower()
+
+
+def backend():
+    # The board class, detected once. EPD_PLATFORM (raspberrypi, sunrisex3
+    # or jetsonnano) skips the detection; None if it names no board, which
+    # implementation() reports.
+    global _backend
+    if _backend is None:
+        name = _platform()
+        if name:
+            if name not in BACKENDS:
+                return None
+            _backend = BACKENDS[name]
+        elif _is_raspberry_pi():
+            _backend = RaspberryPi
+        elif os.path.exists('/sys/bus/platform/drivers/gpio-x3'):
+            _backend = SunriseX3
+        else:
+            _backend = JetsonNano
+    return _backend
+
+
+def _is_raspberry_pi():
+    try:
+        with open('/proc/cpuinfo') as f:
+            return "Raspberry" in f.read()
+    except OSError:
+        return False
+
+
+def implementation():
+    # Opens the GPIO pins and SPI libraries on first use, then binds the
+    # board's methods as module functions so later calls skip this.
+    global _implementation
+    with _lock:
+        if _implementation is None:
+            board = backend()
+            if board is None:
+                raise ValueError("Unknown EPD_PLATFORM %r, expected one of %s" % (_platform(), ", ".join(BACKENDS)))
+            instance = board()
+            for func in [x for x in dir(instance) if not x.startswith('_')]:
+                setattr(sys.modules[__name__], func, getattr(instance, func))
+            _implementation = instance
+    return _implementation
+
+
+def __getattr__(name):
+    # Class constants such as the pin numbers don't need the hardware;
+    # anything else comes from the opened board, which is also where
+    # instance attributes like SPI live.
+    error = AttributeError("module %r has no attribute %r" % (__name__, name))
+    if name.startswith('_'):
+        raise error
+    board = backend()
+    if board is None:
+        # Without a board, only names some board has are worth the
+        # ValueError from implementation().
+        if not any(hasattr(b, name) for b in BACKENDS.values()):
+            raise error
+    elif name in vars(board) and not callable(vars(board)[name]):
+        return vars(board)[name]
+    instance = implementation()
+    try:
+        return getattr(instance, name)
+    except AttributeError:
+        raise error from None
 
 ### END OF FILE ###
@@ -0,0 +1,217 @@
+# Frame packing for the 4.26" panel. Kept free of any hardware access so
+# that the API server can produce ready-to-send buffers as well.
+
+import logging
+import re
+import struct
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# 2-bit code of each 'L' level as getbuffer_4Gray stores it: GRAY2 and
+# GRAY3 are first moved down to 0x80 and 0x40, then the top two bits kept.
+def _gray_code(level):
+    if level == 0xC0:
+        level = 0x80
+    elif level == 0x80:
+        level = 0x40
+    return level >> 6
+
+GRAY_CODE_LUT = [_gray_code(level) for level in range(256)]
+# Moves a 2-bit code into pixel slot k (0 = most significant) of a byte.
+GRAY_SHIFT_TABLES = [bytes((code & 0x03) << (6 - 2 * k) for code in range(256)) for k in range(4)]
+
+# Bit written to the 0x24 / 0x26 RAM planes for each 2-bit gray code.
+PLANE_0x24_BITS = (1, 0, 1, 0)
+PLANE_0x26_BITS = (1, 1, 0, 0)
+
+def _plane_nibble(packed, bits):
+    # The four pixels of a getbuffer_4Gray byte, most significant first.
+    return (bits[(packed >> 6) & 0x03] << 3 | bits[(packed >> 4) & 0x03] << 2 |
+            bits[(packed >> 2) & 0x03] << 1 | bits[packed & 0x03])
+
+# Each plane byte covers eight pixels: the high nibble comes from the even
+# getbuffer_4Gray byte and the low nibble from the odd one.
+PLANE_0x24_HI = bytes(_plane_nibble(b, PLANE_0x24_BITS) << 4 for b in range(256))
+PLANE_0x24_LO = bytes(_plane_nibble(b, PLANE_0x24_BITS) for b in range(256))
+PLANE_0x26_HI = bytes(_plane_nibble(b, PLANE_0x26_BITS) << 4 for b in range(256))
+PLANE_0x26_LO = bytes(_plane_nibble(b, PLANE_0x26_BITS) for b in range(256))
+
+def _or_bytes(parts):
+    # Bitwise OR of equally long byte strings, done as one big integer each.
+    acc = 0
+    for part in parts:
+        acc |= int.from_bytes(part, 'big')
+    return acc.to_bytes(len(parts[0]), 'big')
+
+def xor_bytes(a, b):
+    return (int.from_bytes(a, 'big') ^ int.from_bytes(b, 'big')).to_bytes(len(a), 'big')
+
+def pack_1bit(image, width, height):
+    # Pillow packs mode '1' rows MSB first with 1 = white, which is
+    # exactly the RAM layout of the panel, so the frame is packed in C
+    # instead of walking all 384000 pixels in Python.
+    image_monocolor = image.convert('1')
+    imwidth, imheight = image_monocolor.size
+    if imwidth == width and imheight == height:
+        logger.debug("Horizontal")
+    elif imwidth == height and imheight == width:
+        logger.debug("Vertical")
+        # pixel (x, y) lands on (y, height - x - 1)
+        image_monocolor = image_monocolor.transpose(Image.Transpose.ROTATE_90)
+    else:
+        return bytearray(b'\xff' * (int(width / 8) * height))
+    return bytearray(image_monocolor.tobytes())
+
+def pack_4gray(image, width, height):
+    # Map every gray level to its 2-bit code with one LUT pass, then pack
+    # four pixels per byte by OR-ing the shifted columns as big integers.
+    image_monocolor = image.convert('L')
+    imwidth, imheight = image_monocolor.size
+    if imwidth == width and imheight == height:
+        logger.debug("Vertical")
+    elif imwidth == height and imheight == width:
+        logger.debug("Horizontal")
+        image_monocolor = image_monocolor.transpose(Image.Transpose.ROTATE_90)
+    else:
+        return bytearray(b'\xff' * (int(width / 4) * height))
+    codes = image_monocolor.point(GRAY_CODE_LUT).tobytes()
+    return bytearray(_or_bytes([codes[k::4].translate(GRAY_SHIFT_TABLES[k]) for k in range(4)]))
+
+def gray_planes(buf):
+    # The 0x24 and 0x26 RAM planes for a pack_4gray buffer.
+    buf = bytes(buf)
+    even, odd = buf[0::2], buf[1::2]
+    return (_or_bytes([even.translate(PLANE_0x24_HI), odd.translate(PLANE_0x24_LO)]),
+            _or_bytes([even.translate(PLANE_0x26_HI), odd.translate(PLANE_0x26_LO)]))
+
+# A timeline is a header followed by frames, each one the runs of rows
+# that differ from the frame before it (the first from an all-white
+# frame). All integers are little-endian.
+TIMELINE_MAGIC = b'EPTL'
+TIMELINE_HEADER = struct.Struct('<4sHIH')   # magic, frame count, frame size, row bytes
+TIMELINE_FRAME = struct.Struct('<qH')       # display time (epoch seconds), patch count
+TIMELINE_PATCH = struct.Struct('<II')       # byte offset, length
+
+def encode_timeline(frames, row_bytes):
+    # frames is a list of (timestamp, buffer) in display order.
+    frame_size = len(frames[0][1]) if frames else 0
+    out = [TIMELINE_HEADER.pack(TIMELINE_MAGIC, len(frames), frame_size, row_bytes)]
+    previous = b'\xff' * frame_size
+    for timestamp, buf in frames:
+        patches = []
+        run_start = None
+        for start in range(0, frame_size + row_bytes, row_bytes):
+            changed = start < frame_size and buf[start:start + row_bytes] != previous[start:start + row_bytes]
+            if changed and run_start is None:
+                run_start = start
+            elif not changed and run_start is not None:
+                patches.append((run_start, bytes(buf[run_start:start])))
+                run_start = None
+        out.append(TIMELINE_FRAME.pack(int(timestamp), len(patches)))
+        for offset, data in patches:
+            out.append(TIMELINE_PATCH.pack(offset, len(data)))
+            out.append(data)
+        previous = buf
+    return b''.join(out)
+
+def _unpack(layout, blob, pos):
+    if pos + layout.size > len(blob):
+        raise ValueError("truncated frame timeline")
+    return layout.unpack_from(blob, pos)
+
+def decode_timeline(blob):
+    # Yields (timestamp, buffer) per frame. The buffer is one bytearray
+    # patched in place, so copy it to keep a frame past the next step.
+    # A damaged blob raises ValueError, at the latest after the last frame.
+    magic, count, frame_size, _ = _unpack(TIMELINE_HEADER, blob, 0)
+    if magic != TIMELINE_MAGIC:
+        raise ValueError("not a frame timeline")
+    buf = bytearray(b'\xff' * frame_size)
+    pos = TIMELINE_HEADER.size
+    for _ in range(count):
+        timestamp, patches = _unpack(TIMELINE_FRAME, blob, pos)
+        pos += TIMELINE_FRAME.size
+        for _ in range(patches):
+            offset, length = _unpack(TIMELINE_PATCH, blob, pos)
+            pos += TIMELINE_PATCH.size
+            if offset + length > frame_size or pos + length > len(blob):
+                raise ValueError("corrupt frame timeline")
+            buf[offset:offset + length] = blob[pos:pos + length]
+            pos += length
+        yield timestamp, buf
+    if pos != len(blob):
+        raise ValueError("frame timeline longer than its frames")
+
+# Run-length encoding for packed frames: a series of records, each a
+# LEB128 varint header (length << 1 | is_run) followed by the one byte
+# repeated for a run, or by the literal bytes. Runs shorter than four bytes
+# are cheaper as literals. A frame is mostly 0xFF and an XOR delta
+# between two frames mostly 0x00, so both shrink to a few records.
+RLE_RUN = re.compile(rb'(.)\1{3,}', re.DOTALL)
+
+def _varint(value):
+    out = bytearray()
+    while value > 0x7F:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+    return out
+
+def rle_encode(data):
+    out = bytearray()
+    pos = 0
+    for match in RLE_RUN.finditer(data):
+        start, end = match.span()
+        if start > pos:
+            out += _varint((start - pos) << 1)
+            out += data[pos:start]
+        out += _varint((end - start) << 1 | 1)
+        out.append(data[start])
+        pos = end
+    if pos < len(data):
+        out += _varint((len(data) - pos) << 1)
+        out += data[pos:]
+    return bytes(out)
+
+def rle_decode_into(buf, data, xor=False):
+    # Writes the decoded bytes over buf, or XORs them into it (applying a
+    # delta to the frame buf already holds). Zero runs of a delta are
+    # skipped without touching buf.
+    pos = 0
+    i = 0
+    size = len(data)
+    while i < size:
+        header = 0
+        shift = 0
+        while True:
+            if i >= size:
+                raise ValueError("truncated RLE data")
+            byte = data[i]
+            i += 1
+            header |= (byte & 0x7F) << shift
+            shift += 7
+            if byte < 0x80:
+                break
+        length = header >> 1
+        if pos + length > len(buf):
+            raise ValueError("RLE data longer than the frame")
+        if header & 1:
+            if i >= size:
+                raise ValueError("truncated RLE data")
+            value = data[i]
+            i += 1
+            if not xor:
+                buf[pos:pos + length] = bytes((value,)) * length
+            elif value:
+                buf[pos:pos + length] = xor_bytes(buf[pos:pos + length], bytes((value,)) * length)
+        else:
+            if i + length > size:
+                raise ValueError("truncated RLE data")
+            chunk = data[i:i + length]
+            buf[pos:pos + length] = xor_bytes(buf[pos:pos + length], chunk) if xor else chunk
+            i += length
+        pos += length
+    if pos != len(buf):
+        raise ValueError("RLE data shorter than the frame")
+    return buf
@@ -3,37 +3,200 @@
 import sys
 import os
 import json
+import mmap
+import string
+import threading
+import functools
+import re
+import time
+import hashlib
+import signal
+import struct
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 
 from dotenv import load_dotenv
 
 load_dotenv()
 
 libdir = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'lib')
-from PIL import Image, ImageDraw, ImageFont
+import PIL
+from PIL import Image, ImageChops, ImageDraw, ImageFont
 from datetime import datetime
 if os.path.exists(libdir):
     sys.path.append(libdir)
 
-from waveshare_epd import epd4in26
+from waveshare_epd import framebuffer
 
 API_URL = os.getenv("API_URL", "http://localhost:3000/display")
 API_KEY = os.getenv("API_KEY", "your_auth_key_here")
+# When set, the server renders and packs the frame (see /frame in
+# api-server.py) and the device only downloads and displays it.
+FRAME_URL = os.getenv("FRAME_URL", "")
+# When set, frames for the coming minutes are synced from the server's
+# /timeline and kept in TIMELINE_PATH. A new timeline is fetched once
+# fewer than TIMELINE_MIN_AHEAD minutes of it are left.
+TIMELINE_URL = os.getenv("TIMELINE_URL", "")
+TIMELINE_PATH = os.getenv("TIMELINE_PATH", "/tmp/epd_timeline.bin")
+TIMELINE_MIN_AHEAD = int(os.getenv("TIMELINE_MIN_AHEAD", 5))
+# Daemon mode: when set (the server's /display/wait), the wait between
+# refreshes long-polls the server so a content change is fetched at the
+# next refresh instead of at valid_until.
+CHANGES_URL = os.getenv("CHANGES_URL", "")
 
 DUMP_BMP_PATH = "/tmp/dump.bmp"
 
-def fetch_api_response():
+# Daemon mode: seconds between refreshes, and how often the panel is put
+# to deep sleep and fully re-initialized instead of only refreshed.
+REFRESH_INTERVAL = int(os.getenv("REFRESH_INTERVAL", 60))
+REINIT_INTERVAL = int(os.getenv("REINIT_INTERVAL", 3600))
+
+# Hash of the last frame sent to the panel plus refresh/skip counters,
+# kept across runs so an unchanged frame is never pushed again.
+FRAME_STATE_PATH = os.getenv("FRAME_STATE_PATH", "/tmp/epd_frame_state.json")
+
+# Daemon mode dirty-rectangle refresh: a frame whose changed rectangles
+# cover more than PARTIAL_MAX_DIRTY of the screen, or that follows
+# PARTIAL_FULL_EVERY partial refreshes in a row, gets a full refresh.
+PARTIAL_MAX_DIRTY = float(os.getenv("PARTIAL_MAX_DIRTY", 0.25))
+PARTIAL_FULL_EVERY = int(os.getenv("PARTIAL_FULL_EVERY", 30))
+
+# One keep-alive session to the API server; a failed connect or a 5xx is
+# retried twice with backoff before the fetch gives up.
+SESSION = requests.Session()
+_adapter = HTTPAdapter(max_retries=Retry(total=2, read=0, backoff_factor=1,
+                                         status_forcelist=(502, 503, 504), allowed_methods=frozenset(["GET"])))
+SESSION.mount("http://", _adapter)
+SESSION.mount("https://", _adapter)
+
+def fetch_api_response(cached=None):
+    # Departures come as absolute times (see get_buses), so the payload
+    # stays usable until its valid_until. A cached payload is revalidated
+    # by ETag; on 304 it is kept and only its valid_until moves.
     headers = {"Authorization": f"Bearer {API_KEY}"}
+    if cached and cached.get("etag"):
+        headers["If-None-Match"] = cached["etag"]
     try:
-        response = requests.get(API_URL, headers=headers, timeout=20)
+        response = SESSION.get(API_URL, params={"departures": "absolute"}, headers=headers, timeout=20)
+        max_age = re.search(r"max-age=(\d+)", response.headers.get("Cache-Control", ""))
+        if response.status_code == 304 and cached:
+            cached["valid_until"] = time.time() + (int(max_age.group(1)) if max_age else 60)
+            return cached
         response.raise_for_status()
-        return response.json()
+        api_response = response.json()
+        if response.headers.get("ETag"):
+            api_response["etag"] = response.headers["ETag"]
+        return api_response
     except Exception as e:
         print(f"API fetch error: {e}")
         return None
 
-def get_buses(api_response):
-    return api_response.get("buses", []) if api_response else []
+# The last frame fetched from FRAME_URL and its version; frames arrive
+# run-length encoded, as an XOR delta against this one when the server
+# still has it, and are decoded in place.
+FRAME_BUF = None
+FRAME_VERSION = None
+
+def fetch_frame():
+    global FRAME_BUF, FRAME_VERSION
+    if FRAME_BUF is None:
+        FRAME_BUF = bytearray(WIDTH // 8 * HEIGHT)
+    headers = {"Authorization": f"Bearer {API_KEY}"}
+    params = {"encoding": "rle"}
+    if FRAME_VERSION:
+        params["base"] = FRAME_VERSION
+        headers["If-None-Match"] = f'"{FRAME_VERSION}"'
+    try:
+        response = SESSION.get(FRAME_URL, params=params, headers=headers, timeout=20)
+        if response.status_code == 304 and FRAME_VERSION:
+            return FRAME_BUF
+        response.raise_for_status()
+        version = response.headers["X-Frame-Version"]
+        base = response.headers.get("X-Frame-Base")
+        if base and base != FRAME_VERSION:
+            raise ValueError(f"delta against unknown frame {base}")
+        FRAME_VERSION = None
+        framebuffer.rle_decode_into(FRAME_BUF, response.content, xor=bool(base))
+        if hashlib.sha256(FRAME_BUF).hexdigest() != version:
+            raise ValueError("frame does not match its version")
+        FRAME_VERSION = version
+        return FRAME_BUF
+    except Exception as e:
+        print(f"Frame fetch error: {e}")
+        return None
+
+def fetch_timeline():
+    headers = {"Authorization": f"Bearer {API_KEY}"}
+    try:
+        response = SESSION.get(TIMELINE_URL, headers=headers, timeout=20)
+        response.raise_for_status()
+        return response.content
+    except Exception as e:
+        print(f"Timeline fetch error: {e}")
+        return None
+
+def wait_for_change(state, timeout):
+    # Sleeps for timeout seconds. With CHANGES_URL set, the server is
+    # long-polled meanwhile, and a change expires the cached payload so
+    # the next refresh fetches it.
+    deadline = time.time() + timeout
+    cached = state.get("display")
+    headers = {"Authorization": f"Bearer {API_KEY}"}
+    while CHANGES_URL and cached and cached.get("etag") and deadline - time.time() > 1:
+        try:
+            response = SESSION.get(CHANGES_URL, params={"etag": cached["etag"], "timeout": int(deadline - time.time())},
+                                   headers=headers, timeout=deadline - time.time() + 10)
+            response.raise_for_status()
+            if response.json().get("changed"):
+                cached["valid_until"] = 0
+                break
+        except Exception as e:
+            print(f"Change wait error: {e}")
+            break
+    time.sleep(max(deadline - time.time(), 0))
+
+@functools.lru_cache(maxsize=8)
+def get_timezone(name):
+    # None (the system zone) for a missing or unknown name.
+    if not name:
+        return None
+    try:
+        try:
+            from zoneinfo import ZoneInfo
+            return ZoneInfo(name)
+        except ImportError:
+            import pytz
+            return pytz.timezone(name)
+    except Exception as e:
+        print(f"Unknown timezone {name}: {e}")
+        return None
+
+def get_buses(api_response, now=None, tz=None):
+    # Departures sent as epoch seconds are turned into the countdown or
+    # clock time as of now, in tz or else the sign's zone ("tz") as given
+    # by the server; ones that have left are dropped.
+    buses = api_response.get("buses", []) if api_response else []
+    now = time.time() if now is None else now
+    if tz is None and api_response:
+        tz = get_timezone(api_response.get("tz"))
+    result = []
+    for bus in buses:
+        if "departure" not in bus:
+            result.append(bus)
+            continue
+        diff_min = int((bus["departure"] - now) // 60)
+        if diff_min < 0:
+            continue
+        local = {
+            "number": bus["number"],
+            "destination": bus["destination"],
+            "time": datetime.fromtimestamp(bus["departure"], tz).strftime("%H:%M")
+        }
+        if diff_min < 30:
+            local["minutes"] = "now" if diff_min == 0 else f"{diff_min} min"
+        result.append(local)
+    return result
 
 def get_weather(api_response):
     return api_response.get("weather", {}) if api_response else {}
@@ -59,21 +222,214 @@ ICON_RAINY = "\uF176"
 ICON_TWILIGHT = "\uE1C6"
 ICON_SUN = "\uE81A"
 
-try:
-    FONT_LARGE = ImageFont.truetype(os.path.join(libdir, "fonts/NotoSans-Regular.ttf"), 42)
-    FONT_MEDIUM = ImageFont.truetype(os.path.join(libdir, "fonts/NotoSans-Regular.ttf"), 34)
-    FONT_SMALL = ImageFont.truetype(os.path.join(libdir, "fonts/NotoSans-Regular.ttf"), 30)
-    FONT_BOLD_LARGE = ImageFont.truetype(os.path.join(libdir, "fonts/NotoSans-Bold.ttf"), 42)
-    FONT_BOLD_MEDIUM = ImageFont.truetype(os.path.join(libdir, "fonts/NotoSans-Bold.ttf"), 34)
-    FONT_BOLD_SMALL = ImageFont.truetype(os.path.join(libdir, "fonts/NotoSans-Bold.ttf"), 30)
-    ICON_LARGE = ImageFont.truetype(os.path.join(libdir, "fonts/MaterialSymbolsOutlined.ttf"), 42)
-    ICON_MEDIUM = ImageFont.truetype(os.path.join(libdir, "fonts/MaterialSymbolsOutlined.ttf"), 34)
-    ICON_SMALL = ImageFont.truetype(os.path.join(libdir, "fonts/MaterialSymbolsOutlined.ttf"), 30)
-    FONT_EMOJI_LARGE = ImageFont.truetype(os.path.join(libdir, "fonts/NotoEmoji-VariableFont_wght.ttf"), 42)
-    FONT_EMOJI_MEDIUM = ImageFont.truetype(os.path.join(libdir, "fonts/NotoEmoji-VariableFont_wght.ttf"), 34)
-    FONT_EMOJI_SMALL = ImageFont.truetype(os.path.join(libdir, "fonts/NotoEmoji-VariableFont_wght.ttf"), 30)
-except:
-    FONT_LARGE = FONT_MEDIUM = FONT_SMALL = FONT_BOLD_LARGE = FONT_BOLD_MEDIUM = FONT_BOLD_SMALL = ICON_LARGE = ICON_MEDIUM = ICON_SMALL = ImageFont.load_default()
+# Fonts are opened on first use, so a missing or broken file only affects
+# the widgets drawn with it. A subset made by `main.py --subset-fonts` in
+# FONT_SUBSET_DIR is used instead of the full font while it is newer.
+FONT_DIR = os.path.join(libdir, "fonts")
+FONT_SUBSET_DIR = os.getenv("FONT_SUBSET_DIR") or os.path.join(FONT_DIR, "subset")
+FONT_SPECS = {
+    "large": ("NotoSans-Regular.ttf", 42),
+    "medium": ("NotoSans-Regular.ttf", 34),
+    "small": ("NotoSans-Regular.ttf", 30),
+    "bold_large": ("NotoSans-Bold.ttf", 42),
+    "bold_medium": ("NotoSans-Bold.ttf", 34),
+    "bold_small": ("NotoSans-Bold.ttf", 30),
+    "icon_large": ("MaterialSymbolsOutlined.ttf", 42),
+    "icon_medium": ("MaterialSymbolsOutlined.ttf", 34),
+    "icon_small": ("MaterialSymbolsOutlined.ttf", 30),
+    "emoji_large": ("NotoEmoji-VariableFont_wght.ttf", 42),
+    "emoji_medium": ("NotoEmoji-VariableFont_wght.ttf", 34),
+    "emoji_small": ("NotoEmoji-VariableFont_wght.ttf", 30),
+}
+
+def font_path(filename):
+    path = os.path.join(FONT_DIR, filename)
+    subset = os.path.join(FONT_SUBSET_DIR, filename)
+    try:
+        if not os.path.exists(path) or os.path.getmtime(subset) >= os.path.getmtime(path):
+            return subset
+    except OSError:
+        pass
+    return path
+
+class FontRegistry:
+    # FONTS["bold_large"] opens the font the first time it is asked for.
+    # A font that fails to load is reported once and replaced by Pillow's
+    # default font at the same size; errors keeps the reasons.
+    def __init__(self, specs):
+        self.specs = specs
+        self.fonts = {}
+        self.errors = {}
+        self.lock = threading.Lock()
+
+    def __getitem__(self, name):
+        font = self.fonts.get(name)
+        if font is None:
+            with self.lock:
+                if name not in self.fonts:
+                    self.fonts[name] = self._load(name)
+                font = self.fonts[name]
+        return font
+
+    def _load(self, name):
+        filename, size = self.specs[name]
+        try:
+            return ImageFont.truetype(font_path(filename), size)
+        except OSError as e:
+            self.errors[name] = str(e)
+            print(f"Font error ({name}, {filename}): {e}")
+            try:
+                return ImageFont.load_default(size)
+            except TypeError:
+                # Pillow before 10.1 has only the fixed-size bitmap font.
+                return ImageFont.load_default()
+
+    def is_icon_font(self, font):
+        return any(self.fonts.get(name) is font for name in self.specs if name.startswith("icon_"))
+
+FONTS = FontRegistry(FONT_SPECS)
+
+# Glyph atlases live here, one sheet (.bin) and metrics (.json) per font
+# and size; the bus and weather widgets only draw these characters.
+GLYPH_ATLAS_DIR = os.getenv("GLYPH_ATLAS_DIR", "/tmp/epd_glyph_atlas")
+ATLAS_TEXT = string.digits + string.ascii_letters + "åäöÅÄÖé :.,-+%/°"
+ATLAS_ICONS = ICON_MOON + ICON_CALENDAR + ICON_RAINY + ICON_TWILIGHT + ICON_SUN
+
+class GlyphAtlas:
+    # Pre-rendered 1-bit glyphs of one font, blitted instead of asking
+    # FreeType to rasterize the same characters every minute. The cache
+    # file name is derived from the font file (path, size, mtime), the
+    # point size and the characters, so changing any of them builds a new
+    # atlas. A font without a file (load_default) gets an empty atlas, and
+    # so does one laid out by raqm: it applies GPOS kerning, which fixed
+    # advances can't reproduce.
+    def __init__(self, font, chars):
+        self.glyphs = {}
+        self.leading = set()
+        path = getattr(font, "path", None)
+        if not isinstance(path, str) or getattr(font, "layout_engine", None) != ImageFont.Layout.BASIC:
+            return
+        try:
+            stat = os.stat(path)
+            key = hashlib.sha1(repr((os.path.abspath(path), stat.st_size, stat.st_mtime_ns, font.size,
+                                     chars, PIL.__version__)).encode()).hexdigest()[:16]
+            prefix = f"{os.path.basename(path)}-{font.size}-"
+            base = os.path.join(GLYPH_ATLAS_DIR, prefix + key)
+            if not self._load(base):
+                self._build(font, chars, base, prefix)
+        except Exception as e:
+            print(f"Glyph atlas error ({os.path.basename(path)} {font.size}): {e}")
+            self.glyphs = {}
+
+    def covers(self, text):
+        return bool(text) and text[0] in self.leading and all(ch in self.glyphs for ch in text)
+
+    def _load(self, base):
+        try:
+            with open(base + ".json") as f:
+                metrics = json.load(f)
+            leading = set(metrics["leading"])
+            with open(base + ".bin", "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as sheet_map:
+                sheet = Image.frombuffer("1", (metrics["width"], metrics["height"]), sheet_map, "raw", "1", 0, 1)
+                self._crop(sheet, metrics["glyphs"])
+            self.leading = leading
+            return True
+        except (OSError, ValueError, KeyError):
+            return False
+
+    def _crop(self, sheet, glyphs):
+        for ch, (x, w, h, ox, oy, advance) in glyphs.items():
+            sprite = sheet.crop((x, 0, x + w, h)) if w and h else None
+            self.glyphs[ch] = (sprite, ox, oy, advance)
+
+    def _build(self, font, chars, base, prefix):
+        # Each sprite is the glyph's ink and its offset from the pen,
+        # measured after a reference glyph. Pillow starts the pen at minus
+        # the first glyph's left bearing when that is negative ("y", "j"),
+        # which moves the whole string by a fraction of a pixel, so text
+        # starting with such a glyph is left to FreeType (not "leading").
+        # Glyphs that don't render the same after the reference glyph are
+        # left out altogether.
+        sprites = []
+        glyphs = {}
+        leading = []
+        x = 0
+        pad = font.size
+        ref = chars[0]
+        ref_advance = font.getlength(ref, mode="1")
+
+        def render(text):
+            canvas = Image.new("1", (pad * 6, pad * 3), 0)
+            ImageDraw.Draw(canvas).text((pad, pad), text, fill=1, font=font)
+            return canvas
+
+        ref_image = render(ref)
+        for ch in dict.fromkeys(chars):
+            alone = render(ch)
+            ink = alone.getbbox()
+            if ink:
+                sprite = alone.crop(ink)
+                after = ImageChops.logical_xor(render(ref + ch), ref_image)
+                mid_ink = after.getbbox()
+                if (not mid_ink or mid_ink[1] != ink[1]
+                        or after.crop(mid_ink).tobytes() != sprite.tobytes()):
+                    continue
+                sprites.append((x, sprite))
+                ox, oy = mid_ink[0] - pad - int(ref_advance), ink[1] - pad
+                w, h = sprite.size
+                if font.getbbox(ch)[0] >= 0 and ink[0] - pad == ox:
+                    leading.append(ch)
+            else:
+                ox = oy = w = h = 0
+                leading.append(ch)
+            glyphs[ch] = (x, w, h, ox, oy, font.getlength(ch, mode="1"))
+            x += w
+        sheet = Image.new("1", (max(x, 1), max([glyph[2] for glyph in glyphs.values()] + [1])), 0)
+        for x, sprite in sprites:
+            sheet.paste(sprite, (x, 0))
+        self._crop(sheet, glyphs)
+        self.leading = set(leading)
+        os.makedirs(GLYPH_ATLAS_DIR, exist_ok=True)
+        for name in os.listdir(GLYPH_ATLAS_DIR):
+            if name.startswith(prefix):
+                os.remove(os.path.join(GLYPH_ATLAS_DIR, name))
+        # The metrics go last: an atlas without them is never loaded.
+        for suffix, data in ((".bin", sheet.tobytes()),
+                             (".json", json.dumps({"width": sheet.width, "height": sheet.height,
+                                                "glyphs": glyphs, "leading": leading}).encode())):
+            with open(base + suffix + ".tmp", "wb") as f:
+                f.write(data)
+            os.replace(base + suffix + ".tmp", base + suffix)
+
+GLYPH_ATLASES = {}
+GLYPH_ATLAS_LOCK = threading.Lock()
+
+def glyph_atlas(font):
+    with GLYPH_ATLAS_LOCK:
+        if font not in GLYPH_ATLASES:
+            chars = ATLAS_ICONS if FONTS.is_icon_font(font) else ATLAS_TEXT
+            GLYPH_ATLASES[font] = GlyphAtlas(font, chars)
+        return GLYPH_ATLASES[font]
+
+@functools.lru_cache(maxsize=1024)
+def text_bbox(font, text):
+    # Kept from FreeType itself: a string's box comes from sub-pixel glyph
+    # outlines and can differ by a pixel from the union of the sprites.
+    return font.getbbox(text)
+
+def draw_text(draw, xy, text, font, fill="black"):
+    # Same pixels as draw.text, from the atlas when it has every character.
+    atlas = glyph_atlas(font)
+    if not atlas.covers(text):
+        draw.text(xy, text, fill=fill, font=font)
+        return
+    x, y = xy
+    pen = 0
+    for ch in text:
+        sprite, ox, oy, advance = atlas.glyphs[ch]
+        if sprite is not None:
+            draw.bitmap((x + int(pen) + ox, y + oy), sprite, fill=fill)
+        pen += advance
 
 def draw_buses(draw, buses):
     y = TOP_MARGIN
@@ -88,28 +444,28 @@ def draw_buses(draw, buses):
             (row_left + BUS_RECT_W, row_bottom)
         ], fill="black")
         bus_num = str(bus["number"])
-        bbox_num = FONT_BOLD_LARGE.getbbox(bus_num)
+        bbox_num = text_bbox(FONTS["bold_large"], bus_num)
         w_num, h_num = bbox_num[2] - bbox_num[0], bbox_num[3] - bbox_num[1]
         num_x = row_left + (BUS_RECT_W - w_num) // 2
         num_y = row_top + (BUS_RECT_H - h_num) // 2
-        draw.text((num_x, num_y), bus_num, fill="white", font=FONT_BOLD_LARGE)
+        draw_text(draw, (num_x, num_y), bus_num, FONTS["bold_large"], fill="white")
 
         dest_x = row_left + BUS_RECT_W + 15
-        bbox_dest = FONT_MEDIUM.getbbox(bus["destination"])
+        bbox_dest = text_bbox(FONTS["medium"], bus["destination"])
         h_dest = bbox_dest[3] - bbox_dest[1]
         dest_y = row_top + (BUS_RECT_H - h_dest) // 2
-        draw.text((dest_x, dest_y), bus["destination"], fill="black", font=FONT_MEDIUM)
+        draw_text(draw, (dest_x, dest_y), bus["destination"], FONTS["medium"], fill="black")
 
         if "minutes" in bus:
             time_str = f"{bus['minutes']}"
         else:
             time_str = bus["time"]
-        bbox_time = FONT_BOLD_LARGE.getbbox(time_str)
+        bbox_time = text_bbox(FONTS["bold_large"], time_str)
         w_time = bbox_time[2] - bbox_time[0]
         h_time = bbox_time[3] - bbox_time[1]
         time_x = row_right - w_time
         time_y = row_top + (BUS_RECT_H - h_time) // 2
-        draw.text((time_x, time_y), time_str, fill="black", font=FONT_BOLD_LARGE)
+        draw_text(draw, (time_x, time_y), time_str, FONTS["bold_large"], fill="black")
 
         y += BUS_RECT_H + BUS_SPACING + 15
 
@@ -121,108 +477,163 @@ def draw_weather(draw, weather):
     temp_text = f"{weather['current_temp']}"
     wind_text = f"{weather.get('wind_condition', '')}"
     
-    draw.text((LEFT_MARGIN, Y_OFFSET_BOTTOM_CONTENT-3), temp_text, fill="black", font=FONT_BOLD_LARGE)
+    draw_text(draw, (LEFT_MARGIN, Y_OFFSET_BOTTOM_CONTENT-3), temp_text, FONTS["bold_large"], fill="black")
     
     if wind_text:
-        bbox_temp = FONT_LARGE.getbbox(temp_text)
+        bbox_temp = text_bbox(FONTS["large"], temp_text)
         w_temp = bbox_temp[2] - bbox_temp[0]
         wind_x = LEFT_MARGIN + w_temp + 15
         wind_y = Y_OFFSET_BOTTOM_CONTENT + 8 
-        draw.text((wind_x, wind_y), wind_text, fill="black", font=FONT_SMALL)
+        draw_text(draw, (wind_x, wind_y), wind_text, FONTS["small"], fill="black")
     y_temp = Y_OFFSET_BOTTOM_CONTENT + 50
     
     low_temp_val = weather.get('later_temp', '-')
     later_temp_time = weather.get('later_temp_time', '-')
 
     if later_temp_time == "noon":
-        bbox_icon = ICON_MEDIUM.getbbox(ICON_SUN)
+        bbox_icon = text_bbox(FONTS["icon_medium"], ICON_SUN)
     elif later_temp_time == "afternoon":
-        bbox_icon = ICON_MEDIUM.getbbox(ICON_TWILIGHT)
+        bbox_icon = text_bbox(FONTS["icon_medium"], ICON_TWILIGHT)
     else:
-        bbox_icon = ICON_MEDIUM.getbbox(ICON_MOON)
+        bbox_icon = text_bbox(FONTS["icon_medium"], ICON_MOON)
     h_icon = bbox_icon[3] - bbox_icon[1]
-    bbox_temp = FONT_MEDIUM.getbbox(low_temp_val)
+    bbox_temp = text_bbox(FONTS["medium"], low_temp_val)
     h_temp = bbox_temp[3] - bbox_temp[1]
     
     icon_y = y_temp + (h_temp - h_icon) + 20 // 2
-    draw.text((LEFT_MARGIN, icon_y), ICON_MOON, fill="black", font=ICON_MEDIUM)
+    draw_text(draw, (LEFT_MARGIN, icon_y), ICON_MOON, FONTS["icon_medium"], fill="black")
     w_icon = bbox_icon[2] - bbox_icon[0]
     temp_x = LEFT_MARGIN + w_icon + 10
-    draw.text((temp_x, y_temp), low_temp_val, fill="black", font=FONT_MEDIUM)
+    draw_text(draw, (temp_x, y_temp), low_temp_val, FONTS["medium"], fill="black")
     
     precip_text = weather.get('precipitation', '')
     if precip_text:
         y_precip = y_temp + 40
-        draw.text((LEFT_MARGIN, y_precip + 7), ICON_RAINY, fill="black", font=ICON_MEDIUM)
-        bbox_rain = ICON_MEDIUM.getbbox(ICON_RAINY)
+        draw_text(draw, (LEFT_MARGIN, y_precip + 7), ICON_RAINY, FONTS["icon_medium"], fill="black")
+        bbox_rain = text_bbox(FONTS["icon_medium"], ICON_RAINY)
         w_rain = bbox_rain[2] - bbox_rain[0]
         precip_x = LEFT_MARGIN + w_rain + 10
-        draw.text((precip_x, y_precip + 4), f"{precip_text}", fill="black", font=FONT_SMALL)
-
-def is_emoji(char):
-    codepoint = ord(char)
-    return (
-        0x1F600 <= codepoint <= 0x1F64F or  # emoticons
-        0x1F300 <= codepoint <= 0x1F5FF or  # symbols & pictographs
-        0x1F680 <= codepoint <= 0x1F6FF or  # transport & map
-        0x1F700 <= codepoint <= 0x1F77F or  # alchemical
-        0x1F780 <= codepoint <= 0x1F7FF or  # Geometric Shapes Extended
-        0x1F800 <= codepoint <= 0x1F8FF or  # Supplemental Arrows-C
-        0x1F900 <= codepoint <= 0x1F9FF or  # Supplemental Symbols and Pictographs
-        0x1FA00 <= codepoint <= 0x1FA6F or  # Chess Symbols
-        0x1FA70 <= codepoint <= 0x1FAFF or  # Symbols and Pictographs Extended-A
-        0x2600 <= codepoint <= 0x26FF or    # Misc symbols
-        0x2700 <= codepoint <= 0x27BF or    # Dingbats
-        0xFE00 <= codepoint <= 0xFE0F or    # Variation Selectors
-        0x1F1E6 <= codepoint <= 0x1F1FF     # Flags
-    )
+        draw_text(draw, (precip_x, y_precip + 4), f"{precip_text}", FONTS["small"], fill="black")
+
+# Codepoints drawn with the emoji font. An emoji cluster also takes the
+# variation selectors, skin tone modifiers, tag characters and
+# ZWJ-joined emoji that follow it, so a sequence is never split across
+# fonts; flags are pairs of regional indicators.
+EMOJI_RANGES = (
+    (0x2600, 0x26FF),    # Misc symbols
+    (0x2700, 0x27BF),    # Dingbats
+    (0x1F1E6, 0x1F1FF),  # Flags
+    (0x1F300, 0x1F5FF),  # symbols & pictographs
+    (0x1F600, 0x1F64F),  # emoticons
+    (0x1F680, 0x1F6FF),  # transport & map
+    (0x1F700, 0x1F77F),  # alchemical
+    (0x1F780, 0x1F7FF),  # Geometric Shapes Extended
+    (0x1F800, 0x1F8FF),  # Supplemental Arrows-C
+    (0x1F900, 0x1F9FF),  # Supplemental Symbols and Pictographs
+    (0x1FA00, 0x1FA6F),  # Chess Symbols
+    (0x1FA70, 0x1FAFF),  # Symbols and Pictographs Extended-A
+)
+_EMOJI = "[" + "".join(f"{chr(start)}-{chr(end)}" for start, end in EMOJI_RANGES) + "]"
+_EMOJI_MODIFIERS = "[\uFE0E\uFE0F\U0001F3FB-\U0001F3FF\U000E0020-\U000E007F]*"
+EMOJI_CLUSTER = re.compile(
+    "[\U0001F1E6-\U0001F1FF]{2}"
+    "|[0-9#*]\uFE0F?\u20E3"
+    f"|{_EMOJI}{_EMOJI_MODIFIERS}(?:\u200D{_EMOJI}{_EMOJI_MODIFIERS})*"
+)
+# Selectors outside an emoji cluster are invisible but would be drawn as
+# boxes by the text font.
+STRAY_SELECTORS = re.compile("[\uFE00-\uFE0F]")
+
+@functools.lru_cache(maxsize=256)
+def shape_mixed_text(text, font, emoji_font):
+    # (x offset, run, font) for each text or emoji run of text.
+    pieces = []
+    pos = 0
+    for match in EMOJI_CLUSTER.finditer(text):
+        if match.start() > pos:
+            pieces.append((STRAY_SELECTORS.sub("", text[pos:match.start()]), font))
+        pieces.append((match.group(), emoji_font))
+        pos = match.end()
+    if pos < len(text):
+        pieces.append((STRAY_SELECTORS.sub("", text[pos:]), font))
+    runs = []
+    x = 0
+    for run, run_font in pieces:
+        if not run:
+            continue
+        runs.append((x, run, run_font))
+        bbox = text_bbox(run_font, run)
+        x += bbox[2] - bbox[0]
+    return tuple(runs)
 
 def draw_mixed_text(draw, pos, text, font, emoji_font, fill="black"):
     x, y = pos
-    buffer = ""
-    i = 0
-    while i < len(text):
-        char = text[i]
-        if is_emoji(char):
-            # Draw buffer with regular font
-            if buffer:
-                draw.text((x, y), buffer, fill=fill, font=font)
-                w = font.getbbox(buffer)[2] - font.getbbox(buffer)[0]
-                x += w
-                buffer = ""
-            # Draw emoji
-            draw.text((x, y), char, fill=fill, font=emoji_font)
-            w = emoji_font.getbbox(char)[2] - emoji_font.getbbox(char)[0]
-            x += w
+    for dx, run, run_font in shape_mixed_text(text, font, emoji_font):
+        if run_font is emoji_font:
+            draw.text((x + dx, y), run, fill=fill, font=emoji_font)
         else:
-            buffer += char
-        i += 1
-    if buffer:
-        draw.text((x, y), buffer, fill=fill, font=font)
+            draw_text(draw, (x + dx, y), run, run_font, fill=fill)
 
 def draw_calendar(draw, calendar):
     right_x = WIDTH // 2 + 10
     event_title = calendar.get('event_date', '')
     if event_title:
-        bbox_icon = ICON_MEDIUM.getbbox(ICON_CALENDAR)
+        bbox_icon = text_bbox(FONTS["icon_medium"], ICON_CALENDAR)
         h_icon = bbox_icon[3] - bbox_icon[1]
-        bbox_title = FONT_MEDIUM.getbbox(event_title.upper())
+        bbox_title = text_bbox(FONTS["medium"], event_title.upper())
         h_title = bbox_title[3] - bbox_title[1]
         icon_y = Y_OFFSET_BOTTOM_CONTENT + (h_title - h_icon) + 20 // 2
-        draw.text((right_x, icon_y), ICON_CALENDAR, fill="black", font=ICON_MEDIUM)
+        draw_text(draw, (right_x, icon_y), ICON_CALENDAR, FONTS["icon_medium"], fill="black")
         w_icon = bbox_icon[2] - bbox_icon[0]
         title_x = right_x + w_icon + 10
-        draw.text((title_x, Y_OFFSET_BOTTOM_CONTENT), event_title.upper(), fill="black", font=FONT_BOLD_MEDIUM)
+        draw_text(draw, (title_x, Y_OFFSET_BOTTOM_CONTENT), event_title.upper(), FONTS["bold_medium"], fill="black")
     event_desc_1 = calendar.get('event_desc_1', '')
     event_desc_2 = calendar.get('event_desc_2', '')
     if event_desc_1:
-        draw_mixed_text(draw, (right_x, Y_OFFSET_BOTTOM_CONTENT+50), event_desc_1, FONT_MEDIUM, FONT_EMOJI_MEDIUM, fill="black")
+        draw_mixed_text(draw, (right_x, Y_OFFSET_BOTTOM_CONTENT+50), event_desc_1, FONTS["medium"], FONTS["emoji_medium"], fill="black")
     if event_desc_2:
-        draw_mixed_text(draw, (right_x, Y_OFFSET_BOTTOM_CONTENT+90), event_desc_2, FONT_MEDIUM, FONT_EMOJI_MEDIUM, fill="black")
+        draw_mixed_text(draw, (right_x, Y_OFFSET_BOTTOM_CONTENT+90), event_desc_2, FONTS["medium"], FONTS["emoji_medium"], fill="black")
 
-def main():
-    api_response = fetch_api_response()
-    buses = get_buses(api_response)
+def subset_fonts():
+    # Optional build step, needs fonttools (pip install fonttools). Cuts
+    # each font down to what the layout can draw: Latin text, the icons in
+    # use and the emoji ranges above. Variable fonts are pinned to their
+    # default instance, which is the one Pillow renders.
+    from fontTools import subset
+    from fontTools.ttLib import TTFont
+    from fontTools.varLib import instancer
+
+    text = [*range(0x20, 0x7F), *range(0xA0, 0x180)] + [ord(ch) for ch in "‐‑–—‘’‚“”„•…€"]
+    emoji = [code for start, end in EMOJI_RANGES for code in range(start, end + 1)]
+    emoji += [ord(ch) for ch in "0123456789#*\u200D\u20E3\uFE0E\uFE0F"]
+    emoji += [*range(0x1F3FB, 0x1F400), *range(0xE0020, 0xE0080)]
+    unicodes = {}
+    for name, (filename, size) in FONT_SPECS.items():
+        kind = name.split("_")[0]
+        unicodes[filename] = emoji if kind == "emoji" else [ord(ch) for ch in ATLAS_ICONS] if kind == "icon" else text
+    os.makedirs(FONT_SUBSET_DIR, exist_ok=True)
+    for filename, codes in unicodes.items():
+        path = os.path.join(FONT_DIR, filename)
+        if not os.path.exists(path):
+            print(f"Font subset skipped ({filename}): not found")
+            continue
+        font = TTFont(path)
+        if "fvar" in font:
+            font = instancer.instantiateVariableFont(font, {axis.axisTag: axis.defaultValue for axis in font["fvar"].axes})
+        options = subset.Options()
+        options.layout_features = ["*"]
+        options.name_IDs = ["*"]
+        options.notdef_outline = True
+        subsetter = subset.Subsetter(options)
+        subsetter.populate(unicodes=codes)
+        subsetter.subset(font)
+        out = os.path.join(FONT_SUBSET_DIR, filename)
+        font.save(out + ".tmp")
+        os.replace(out + ".tmp", out)
+        print(f"{filename}: {os.path.getsize(path) // 1024} KB -> {os.path.getsize(out) // 1024} KB")
+
+def render(api_response, now=None, tz=None):
+    buses = get_buses(api_response, now, tz)
     weather = get_weather(api_response)
     calendar = get_calendar(api_response)
     image = Image.new("1", (WIDTH, HEIGHT), 1)
@@ -231,12 +642,206 @@ def main():
     draw_separator(draw)
     draw_weather(draw, weather)
     draw_calendar(draw, calendar)
-    image.save(DUMP_BMP_PATH)
+    return image
 
-if __name__ == "__main__":
-    main()
+def load_frame_state():
+    # Saved over the defaults, so a state file written by an older version
+    # still has every counter.
+    state = {"hash": None, "refreshed": 0, "skipped": 0}
+    try:
+        with open(FRAME_STATE_PATH) as f:
+            state.update(json.load(f))
+    except (OSError, ValueError, TypeError):
+        pass
+    return state
+
+def save_frame_state(state):
+    tmp_path = FRAME_STATE_PATH + ".tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, FRAME_STATE_PATH)
+    except OSError as e:
+        print(f"Frame state save error: {e}")
+
+def frame_hash(buf):
+    return hashlib.sha256(buf).hexdigest()
+
+def dirty_rects(old, new, row_bytes=WIDTH // 8):
+    # Byte-aligned (x_start, y_start, x_end, y_end) rectangles, one for each
+    # run of consecutive changed rows, spanning the changed byte columns.
+    rects = []
+    band = None
+    for row in range(len(new) // row_bytes):
+        start = row * row_bytes
+        old_row, new_row = old[start:start + row_bytes], new[start:start + row_bytes]
+        if old_row == new_row:
+            if band:
+                rects.append(band)
+                band = None
+            continue
+        diff = int.from_bytes(old_row, "big") ^ int.from_bytes(new_row, "big")
+        first = row_bytes - (diff.bit_length() + 7) // 8
+        last = row_bytes - 1 - ((diff & -diff).bit_length() - 1) // 8
+        if band is None:
+            band = [first, row, last, row]
+        else:
+            band = [min(band[0], first), band[1], max(band[2], last), row]
+    if band:
+        rects.append(band)
+    return [(first * 8, top, last * 8 + 7, bottom) for first, top, last, bottom in rects]
+
+def dirty_fraction(rects):
+    area = sum((x_end - x_start + 1) * (y_end - y_start + 1) for x_start, y_start, x_end, y_end in rects)
+    return area / (WIDTH * HEIGHT)
+
+def get_api_response(state):
+    # The last /display payload is kept in the frame state and reused until
+    # its valid_until, or for longer when the server cannot be reached.
+    cached = state.get("display")
+    if cached and time.time() < cached.get("valid_until", 0):
+        return cached
+    api_response = fetch_api_response(cached)
+    if api_response is None:
+        return cached
+    if "valid_until" in api_response:
+        state["display"] = api_response
+    return api_response
+
+def load_timeline():
+    try:
+        with open(TIMELINE_PATH, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+def save_timeline(blob):
+    tmp_path = TIMELINE_PATH + ".tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(blob)
+        os.replace(tmp_path, TIMELINE_PATH)
+    except OSError as e:
+        print(f"Timeline save error: {e}")
+
+def timeline_frame(blob, now):
+    # The frame due at now and the time of the last frame in the timeline;
+    # no frame once now is past the last frame's minute.
+    due, last = None, None
+    try:
+        for timestamp, buf in framebuffer.decode_timeline(blob):
+            if len(buf) != WIDTH // 8 * HEIGHT:
+                raise ValueError(f"unexpected frame size {len(buf)}")
+            if timestamp <= now:
+                due = bytearray(buf)
+            last = timestamp
+    except (ValueError, struct.error) as e:
+        print(f"Timeline decode error: {e}")
+        return None, None
+    if last is None or now >= last + 60:
+        return None, last
+    return due, last
+
+def get_timeline_frame():
+    # Served from the local timeline file; the server is only contacted
+    # when it runs short, and an outage just uses up what is left.
+    now = time.time()
+    blob = load_timeline()
+    buf, last = timeline_frame(blob, now) if blob else (None, None)
+    if buf is None or last - now < TIMELINE_MIN_AHEAD * 60:
+        fetched = fetch_timeline()
+        if fetched:
+            fetched_buf, _ = timeline_frame(fetched, now)
+            if fetched_buf is not None:
+                save_timeline(fetched)
+                buf = fetched_buf
+    return buf
+
+def get_frame(state, dump_path=None):
+    buf = get_timeline_frame() if TIMELINE_URL else None
+    if buf is None and FRAME_URL:
+        buf = fetch_frame()
+    if buf is None:
+        image = render(get_api_response(state))
+        if dump_path:
+            image.save(dump_path)
+        buf = framebuffer.pack_1bit(image, WIDTH, HEIGHT)
+    return buf
+
+def main(state):
+    return get_frame(state, DUMP_BMP_PATH)
+
+def run_daemon():
+    # Fonts, the EPD instance, the GPIO handles and the HTTP session all
+    # live for the whole process. The panel is only re-initialized after a
+    # deep sleep, which happens every REINIT_INTERVAL seconds or after a
+    # failed refresh. While it stays awake its RAM keeps the last frame, so
+    # small changes are sent as partial refreshes of the dirty rectangles.
+    from waveshare_epd import epd4in26
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
     epd = epd4in26.EPD()
-    epd.init_Fast()
-    Himage = Image.open(DUMP_BMP_PATH)
-    epd.display_Fast(epd.getbuffer(Himage))
-    epd.sleep()
+    state = load_frame_state()
+    initialized_at = None
+    previous = None
+    partials = 0
+    try:
+        while True:
+            try:
+                buf = get_frame(state)
+            except Exception as e:
+                # e.g. nothing to draw yet because the API was never reached;
+                # try again next interval as a cron run would.
+                print(f"Frame error: {e}")
+                wait_for_change(state, REFRESH_INTERVAL - time.time() % REFRESH_INTERVAL)
+                continue
+            if frame_hash(buf) == state["hash"]:
+                state["skipped"] += 1
+            else:
+                try:
+                    if initialized_at is not None and time.monotonic() - initialized_at >= REINIT_INTERVAL:
+                        epd.sleep()
+                        initialized_at = None
+                    rects = dirty_rects(previous, buf) if initialized_at is not None and previous is not None else []
+                    if rects and partials < PARTIAL_FULL_EVERY and dirty_fraction(rects) <= PARTIAL_MAX_DIRTY:
+                        epd.display_Partial_Windows(buf, previous, rects)
+                        partials += 1
+                        state["partial"] = state.get("partial", 0) + 1
+                    else:
+                        if initialized_at is None or partials:
+                            epd.init_Fast()
+                            initialized_at = time.monotonic()
+                        epd.display_Base_Fast(buf)
+                        partials = 0
+                    # buf may be FRAME_BUF, which the next fetch overwrites
+                    previous = bytes(buf)
+                    state["hash"] = frame_hash(buf)
+                    state["refreshed"] += 1
+                except Exception as e:
+                    print(f"Display refresh error: {e}")
+                    initialized_at = None
+                    previous = None
+            save_frame_state(state)
+            wait_for_change(state, REFRESH_INTERVAL - time.time() % REFRESH_INTERVAL)
+    finally:
+        if initialized_at is not None:
+            epd.sleep()
+
+if __name__ == "__main__":
+    if "--subset-fonts" in sys.argv:
+        subset_fonts()
+    elif "--daemon" in sys.argv:
+        run_daemon()
+    else:
+        from waveshare_epd import epd4in26
+        state = load_frame_state()
+        buf = main(state)
+        epd = epd4in26.EPD()
+        if frame_hash(buf) == state["hash"]:
+            state["skipped"] += 1
+        else:
+            epd.init_Fast()
+            epd.display_Fast(buf)
+            epd.sleep()
+            state["hash"] = frame_hash(buf)
+            state["refreshed"] += 1
+        save_frame_state(state)
@@ -0,0 +1,18 @@
+import importlib.util
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'lib'))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope="session")
+def api_server():
+    # api-server.py is not importable by name.
+    spec = importlib.util.spec_from_file_location("api_server", os.path.join(ROOT, "api-server.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,123 @@
+from types import SimpleNamespace
+
+import pytest
+from caldav.lib import error as dav_error
+
+
+def fake_object(url, etag="1"):
+    return SimpleNamespace(url=url, etag=etag, data="BEGIN:VCALENDAR",
+                           vobject_instance=SimpleNamespace(vevent=object()))
+
+
+class FakeCollection:
+    # Stands in for caldav's SynchronizableCalendarObjectCollection.
+    def __init__(self, server):
+        self.server = server
+        self.objects = dict(server.objects)
+
+    def __iter__(self):
+        return iter(list(self.objects.values()))
+
+    def sync(self):
+        self.server.syncs += 1
+        if self.server.token_expired:
+            raise dav_error.ReportError("valid-sync-token")
+        updated = [obj for url, obj in self.server.objects.items()
+                   if url not in self.objects or self.objects[url].etag != obj.etag]
+        deleted = [obj for url, obj in self.objects.items() if url not in self.server.objects]
+        self.objects = dict(self.server.objects)
+        return updated, deleted
+
+
+class FakeCalendar:
+    def __init__(self):
+        self.objects = {}
+        self.token = 1
+        self.token_expired = False
+        self.full_loads = 0
+        self.syncs = 0
+
+    def put(self, obj):
+        self.objects[obj.url] = obj
+        self.token += 1
+
+    def delete(self, url):
+        del self.objects[url]
+        self.token += 1
+
+    def get_property(self, prop):
+        return str(self.token)
+
+    def objects_by_sync_token(self, load_objects=False):
+        self.full_loads += 1
+        self.token_expired = False
+        return FakeCollection(self)
+
+
+@pytest.fixture
+def session(api_server, monkeypatch):
+    calendar = FakeCalendar()
+    calendar.put(fake_object("/cal/a.ics"))
+    calendar.put(fake_object("/cal/b.ics"))
+    session = api_server.CalendarSession("https://dav.example", "user", "secret", 0)
+    monkeypatch.setattr(session, "_discover", lambda: calendar)
+    session.server = calendar
+    return session
+
+
+def urls(events):
+    return sorted(obj.url for obj in events)
+
+
+def test_first_refresh_loads_everything(session):
+    assert urls(session.refresh()) == ["/cal/a.ics", "/cal/b.ics"]
+    assert session.server.full_loads == 1
+    assert session.stats["objects_loaded"] == 2
+
+
+def test_unchanged_token_skips_sync(session):
+    session.refresh()
+    assert urls(session.refresh()) == ["/cal/a.ics", "/cal/b.ics"]
+    assert session.server.syncs == 0
+    assert session.stats["unchanged"] == 1
+
+
+def test_moved_token_loads_only_changes(session):
+    session.refresh()
+    session.server.put(fake_object("/cal/b.ics", etag="2"))
+    session.server.put(fake_object("/cal/c.ics"))
+    assert urls(session.refresh()) == ["/cal/a.ics", "/cal/b.ics", "/cal/c.ics"]
+    assert session.server.syncs == 1
+    assert session.server.full_loads == 1
+    assert session.stats["objects_loaded"] == 4
+
+
+def test_deleted_hrefs_are_dropped(session):
+    session.refresh()
+    session.indexes[None] = object()
+    session.server.delete("/cal/a.ics")
+    assert urls(session.refresh()) == ["/cal/b.ics"]
+    assert session.indexes == {}
+
+
+def test_expired_token_falls_back_to_full_resync(session):
+    session.refresh()
+    session.server.delete("/cal/a.ics")
+    session.server.put(fake_object("/cal/c.ics"))
+    session.server.token_expired = True
+    assert urls(session.refresh()) == ["/cal/b.ics", "/cal/c.ics"]
+    assert session.server.full_loads == 2
+    assert session.stats["resyncs"] == 1
+    # The new collection syncs normally again
+    session.server.put(fake_object("/cal/d.ics"))
+    assert urls(session.refresh()) == ["/cal/b.ics", "/cal/c.ics", "/cal/d.ics"]
+    assert session.server.full_loads == 2
+
+
+def test_other_errors_restart_discovery(session, monkeypatch):
+    session.refresh()
+    session.server.put(fake_object("/cal/c.ics"))
+    monkeypatch.setattr(FakeCollection, "sync", lambda self: 1 / 0)
+    with pytest.raises(ZeroDivisionError):
+        session.refresh()
+    assert session.calendar is None and session.collection is None
@@ -0,0 +1,80 @@
+import random
+
+import pytest
+
+import main
+
+ROW_BYTES = main.WIDTH // 8
+FRAME_SIZE = ROW_BYTES * main.HEIGHT
+
+
+def blank():
+    return bytearray(b'\xff' * FRAME_SIZE)
+
+
+def brute_force_rects(old, new):
+    # Bands of consecutive changed rows, each spanning the first to last
+    # changed byte column of any of its rows.
+    rects = []
+    band = None
+    for row in range(main.HEIGHT):
+        cols = [col for col in range(ROW_BYTES) if old[row * ROW_BYTES + col] != new[row * ROW_BYTES + col]]
+        if not cols:
+            if band:
+                rects.append(band)
+            band = None
+        elif band is None:
+            band = [cols[0], row, cols[-1], row]
+        else:
+            band = [min(band[0], cols[0]), band[1], max(band[2], cols[-1]), row]
+    if band:
+        rects.append(band)
+    return [(first * 8, top, last * 8 + 7, bottom) for first, top, last, bottom in rects]
+
+
+def test_unchanged_frame_has_no_rects():
+    assert main.dirty_rects(blank(), blank()) == []
+
+
+@pytest.mark.parametrize("col, bit", [(0, 0x80), (0, 0x01), (ROW_BYTES - 1, 0x80), (ROW_BYTES - 1, 0x01), (37, 0x10)])
+def test_single_changed_bit(col, bit):
+    new = blank()
+    new[5 * ROW_BYTES + col] ^= bit
+    assert main.dirty_rects(blank(), new) == [(col * 8, 5, col * 8 + 7, 5)]
+
+
+def test_first_and_last_byte_of_a_row():
+    new = blank()
+    new[0] ^= 0x80
+    new[ROW_BYTES - 1] ^= 0x01
+    assert main.dirty_rects(blank(), new) == [(0, 0, main.WIDTH - 1, 0)]
+
+
+def test_last_row():
+    new = blank()
+    new[-1] = 0
+    assert main.dirty_rects(blank(), new) == [(main.WIDTH - 8, main.HEIGHT - 1, main.WIDTH - 1, main.HEIGHT - 1)]
+
+
+def test_bands_are_split_by_unchanged_rows_and_widened_within():
+    new = blank()
+    new[10 * ROW_BYTES + 4] = 0
+    new[11 * ROW_BYTES + 2] = 0
+    new[12 * ROW_BYTES + 9] = 0
+    new[40 * ROW_BYTES + 50] = 0
+    assert main.dirty_rects(blank(), new) == [(16, 10, 79, 12), (400, 40, 407, 40)]
+
+
+def test_random_frames_match_brute_force():
+    rng = random.Random(7)
+    for _ in range(30):
+        old, new = blank(), blank()
+        for _ in range(rng.randint(1, 40)):
+            new[rng.randrange(FRAME_SIZE)] ^= 1 << rng.randrange(8)
+        assert main.dirty_rects(old, new) == brute_force_rects(old, new)
+
+
+def test_dirty_fraction():
+    assert main.dirty_fraction([]) == 0
+    assert main.dirty_fraction([(0, 0, main.WIDTH - 1, main.HEIGHT - 1)]) == 1
+    assert main.dirty_fraction([(0, 0, 7, 0), (8, 1, 15, 2)]) == 24 / (main.WIDTH * main.HEIGHT)
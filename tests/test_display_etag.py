@@ -0,0 +1,61 @@
+import pytest
+
+NOW = 1717236000
+
+
+def bus(minutes, number="4"):
+    return {"number": number, "destination": "Slussen", "departure": NOW + minutes * 60}
+
+
+@pytest.fixture
+def payload(api_server):
+    def payload(buses, valid_until=None):
+        return {
+            "buses": buses,
+            "weather": {"current_temp": "18.0°C"},
+            "calendar": {},
+            "meta": {"latency_ms": {}},
+            "valid_until": valid_until if valid_until is not None else api_server.departures_valid_until(buses, NOW),
+        }
+    return payload
+
+
+def test_drawn_departures(api_server):
+    buses = [bus(m) for m in (-1, 2, 4, 6, 9, 12, 20)]
+    assert api_server.drawn_departures(buses, NOW, NOW + 5 * 60) == [bus(m) for m in (2, 4, 6, 9, 12)]
+    assert api_server.drawn_departures(buses, NOW, NOW) == [bus(m) for m in (2, 4, 6)]
+
+
+def test_departed_bus_still_in_the_window_does_not_change_etag(api_server, payload):
+    buses = [bus(m) for m in (3, 6, 9, 40)]
+    with_departed = payload([bus(-0.5)] + buses, valid_until=NOW + 300)
+    without = payload(buses, valid_until=NOW + 300)
+    assert api_server.display_etag(with_departed, NOW) == api_server.display_etag(without, NOW)
+
+
+def test_bus_entering_the_lookahead_does_not_change_etag(api_server, payload):
+    buses = [bus(m) for m in (3, 6, 9, 40)]
+    assert (api_server.display_etag(payload(buses, NOW + 300), NOW)
+            == api_server.display_etag(payload(buses + [bus(59)], NOW + 300), NOW))
+
+
+def test_change_to_a_drawn_departure_changes_etag(api_server, payload):
+    buses = [bus(m) for m in (3, 6, 9, 40)]
+    delayed = [bus(m) for m in (3, 7, 9, 40)]
+    assert (api_server.display_etag(payload(buses, NOW + 300), NOW)
+            != api_server.display_etag(payload(delayed, NOW + 300), NOW))
+
+
+def test_etag_ignores_meta_and_valid_until(api_server, payload):
+    buses = [bus(m) for m in (3, 6, 9, 40)]
+    later = payload(buses, NOW + 300)
+    later["meta"] = {"latency_ms": {"weather": 12}}
+    later["valid_until"] = NOW + 240
+    assert api_server.display_etag(payload(buses, NOW + 300), NOW) == api_server.display_etag(later, NOW)
+
+
+def test_relative_departures_are_hashed_as_sent(api_server):
+    data = {"buses": [{"number": "4", "destination": "Slussen", "minutes": "3 min", "time": "10:03"}],
+            "weather": {}, "calendar": {}}
+    moved = dict(data, buses=[dict(data["buses"][0], minutes="2 min")])
+    assert api_server.display_etag(data) != api_server.display_etag(moved)
@@ -0,0 +1,67 @@
+import importlib.util
+import os
+import sys
+
+import pytest
+
+import waveshare_epd
+
+
+class FakeBoard:
+    RST_PIN = 17
+    BUSY_POLL = 0.01
+    opened = 0
+
+    def __init__(self):
+        FakeBoard.opened += 1
+        self.SPI = "spi"
+        self.GPIO_BUSY_PIN = "busy"
+
+    def module_init(self):
+        return 0
+
+
+@pytest.fixture
+def epdconfig(monkeypatch):
+    # A fresh copy, so nothing is cached from another test.
+    def load(platform):
+        monkeypatch.setenv("EPD_PLATFORM", platform)
+        path = os.path.join(os.path.dirname(waveshare_epd.__file__), "epdconfig.py")
+        spec = importlib.util.spec_from_file_location("epdconfig_under_test", path)
+        module = importlib.util.module_from_spec(spec)
+        monkeypatch.setitem(sys.modules, spec.name, module)
+        spec.loader.exec_module(module)
+        module.BACKENDS["fake"] = FakeBoard
+        FakeBoard.opened = 0
+        return module
+    return load
+
+
+def test_constants_do_not_open_the_board(epdconfig):
+    module = epdconfig("fake")
+    assert module.RST_PIN == 17
+    assert module.BUSY_POLL == 0.01
+    assert FakeBoard.opened == 0
+
+
+def test_methods_and_instance_attributes_open_the_board_once(epdconfig):
+    module = epdconfig("fake")
+    assert module.module_init() == 0
+    assert module.SPI == "spi"
+    assert module.GPIO_BUSY_PIN == "busy"
+    assert FakeBoard.opened == 1
+
+
+def test_unknown_name(epdconfig):
+    module = epdconfig("fake")
+    assert not hasattr(module, "foo")
+    assert not hasattr(module, "_private")
+
+
+def test_unknown_platform_is_reported_on_use(epdconfig):
+    module = epdconfig("commodore64")
+    assert not hasattr(module, "foo")
+    with pytest.raises(ValueError, match="commodore64"):
+        module.module_init()
+    with pytest.raises(ValueError, match="commodore64"):
+        module.implementation()
@@ -0,0 +1,134 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+import vobject
+
+STOCKHOLM = "Europe/Stockholm"
+WINDOW = (datetime(2024, 3, 4), datetime(2024, 3, 11))
+
+
+def parse(*vevents):
+    body = "\r\n".join(["BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//test//EN"] + list(vevents) + ["END:VCALENDAR"])
+    return SimpleNamespace(vobject_instance=vobject.readOne(body))
+
+
+def vevent(uid, *lines, summary=None):
+    return "\r\n".join(["BEGIN:VEVENT", f"UID:{uid}", f"SUMMARY:{summary or uid}", "DTSTAMP:20240101T000000Z"]
+                       + list(lines) + ["END:VEVENT"])
+
+
+@pytest.fixture
+def expand(api_server):
+    def expand(*lines, window=WINDOW, tz=None):
+        event = parse(vevent("e", *lines)).vobject_instance.vevent
+        return list(api_server.expand_event(event, *window, tz=tz))
+    return expand
+
+
+@pytest.fixture
+def tz(api_server):
+    return api_server.get_timezone(STOCKHOLM)
+
+
+def starts(occurrences):
+    return [occurrence.start for occurrence in occurrences]
+
+
+def test_rrule_with_exdate(expand):
+    occurrences = expand("DTSTART:20240301T090000", "DTEND:20240301T100000",
+                         "RRULE:FREQ=DAILY", "EXDATE:20240306T090000,20240308T090000")
+    assert starts(occurrences) == [datetime(2024, 3, day, 9) for day in (4, 5, 7, 9, 10)]
+    assert all(o.end - o.start == timedelta(hours=1) for o in occurrences)
+
+
+def test_rrule_with_tz_aware_exdate(expand, tz):
+    occurrences = expand(f"DTSTART;TZID={STOCKHOLM}:20240301T090000", f"DTEND;TZID={STOCKHOLM}:20240301T093000",
+                         "RRULE:FREQ=DAILY;COUNT=8", f"EXDATE;TZID={STOCKHOLM}:20240305T090000", tz=tz)
+    assert starts(occurrences) == [datetime(2024, 3, day, 9) for day in (4, 6, 7, 8)]
+
+
+def test_all_day_event(expand):
+    (occurrence,) = expand("DTSTART;VALUE=DATE:20240305", "DTEND;VALUE=DATE:20240306")
+    assert occurrence == (datetime(2024, 3, 5), datetime(2024, 3, 6), "e")
+
+
+def test_all_day_event_without_dtend_lasts_a_day(expand):
+    (occurrence,) = expand("DTSTART;VALUE=DATE:20240305")
+    assert occurrence.end == datetime(2024, 3, 6)
+
+
+def test_recurring_all_day_event(expand):
+    occurrences = expand("DTSTART;VALUE=DATE:20240101", "RRULE:FREQ=WEEKLY;BYDAY=TU,FR")
+    assert starts(occurrences) == [datetime(2024, 3, 5), datetime(2024, 3, 8)]
+
+
+def test_all_day_event_is_not_shifted_by_tz(expand, tz):
+    (occurrence,) = expand("DTSTART;VALUE=DATE:20240305", tz=tz)
+    assert occurrence.start == datetime(2024, 3, 5)
+
+
+@pytest.mark.parametrize("dtstart,dtend,included", [
+    ("20240303T230000", "20240304T010000", True),   # straddles the start
+    ("20240310T230000", "20240311T010000", True),   # straddles the end
+    ("20240303T220000", "20240304T000000", False),  # ends as the window starts
+    ("20240311T000000", "20240311T010000", False),  # starts as the window ends
+    ("20240301T000000", "20240320T000000", True),   # covers the whole window
+])
+def test_window_edges(expand, dtstart, dtend, included):
+    assert bool(expand(f"DTSTART:{dtstart}", f"DTEND:{dtend}")) == included
+
+
+def test_recurring_occurrence_straddling_window_start(expand):
+    occurrences = expand("DTSTART:20240301T230000", "DURATION:PT2H", "RRULE:FREQ=DAILY;COUNT=3")
+    assert starts(occurrences) == [datetime(2024, 3, 3, 23)]
+
+
+def test_recurring_occurrence_starting_at_window_end_is_left_out(expand):
+    occurrences = expand("DTSTART:20240310T000000", "DURATION:PT1H", "RRULE:FREQ=DAILY")
+    assert starts(occurrences) == [datetime(2024, 3, 10)]
+
+
+def test_utc_event_is_shown_in_the_signs_zone(expand, tz):
+    (occurrence,) = expand("DTSTART:20240305T080000Z", "DTEND:20240305T090000Z", tz=tz)
+    assert occurrence[:2] == (datetime(2024, 3, 5, 9), datetime(2024, 3, 5, 10))
+
+
+def test_rrule_keeps_wall_clock_across_dst(expand, tz):
+    window = (datetime(2024, 3, 29), datetime(2024, 4, 2))
+    occurrences = expand(f"DTSTART;TZID={STOCKHOLM}:20240301T090000", "DURATION:PT1H", "RRULE:FREQ=DAILY",
+                         window=window, tz=tz)
+    assert starts(occurrences) == [datetime(2024, 3, day, 9) for day in (29, 30, 31)] + [datetime(2024, 4, 1, 9)]
+
+
+def test_floating_event_is_kept_as_is(expand, tz):
+    (occurrence,) = expand("DTSTART:20240305T080000", "DTEND:20240305T090000", tz=tz)
+    assert occurrence.start == datetime(2024, 3, 5, 8)
+
+
+def test_build_event_index_replaces_overridden_instances(api_server, tz):
+    obj = parse(
+        vevent("r", f"DTSTART;TZID={STOCKHOLM}:20240301T090000", "DURATION:PT1H", "RRULE:FREQ=DAILY;COUNT=10",
+               summary="standup"),
+        vevent("r", f"RECURRENCE-ID;TZID={STOCKHOLM}:20240305T090000", f"DTSTART;TZID={STOCKHOLM}:20240305T140000",
+               "DURATION:PT1H", summary="moved"),
+    )
+    index = api_server.build_event_index([obj], datetime(2024, 3, 4), lookahead=timedelta(days=3), tz=tz)
+    assert [(o.start, o.summary) for o in index.occurrences] == [
+        (datetime(2024, 3, 4, 9), "standup"),
+        (datetime(2024, 3, 5, 14), "moved"),
+        (datetime(2024, 3, 6, 9), "standup"),
+    ]
+
+
+def test_next_event_prefers_the_one_on_now(api_server):
+    Occurrence = api_server.Occurrence
+    index = api_server.EventIndex([
+        Occurrence(datetime(2024, 3, 4, 8), datetime(2024, 3, 4, 18), "long"),
+        Occurrence(datetime(2024, 3, 4, 10), datetime(2024, 3, 4, 11), "short"),
+        Occurrence(datetime(2024, 3, 5, 9), datetime(2024, 3, 5, 10), "tomorrow"),
+    ], datetime(2024, 3, 4))
+    assert index.next_event(datetime(2024, 3, 4, 7)).summary == "long"
+    assert index.next_event(datetime(2024, 3, 4, 12)).summary == "long"
+    assert index.next_event(datetime(2024, 3, 4, 18)).summary == "tomorrow"
+    assert index.next_event(datetime(2024, 3, 5, 10)) is None
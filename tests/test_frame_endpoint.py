@@ -0,0 +1,53 @@
+import threading
+from http.server import HTTPServer
+
+import pytest
+import requests
+from waveshare_epd import framebuffer
+
+FRAME_SIZE = 800 // 8 * 480
+
+
+@pytest.fixture
+def server(api_server, monkeypatch):
+    frames = [bytearray(b'\xff' * FRAME_SIZE)]
+    monkeypatch.setattr(api_server, "get_frame", lambda mode="1bit", profile=None: frames[-1])
+    monkeypatch.setattr(api_server, "FRAMES", api_server.FrameHistory(4))
+    monkeypatch.setattr(api_server.SimpleHandler, "log_message", lambda *args: None)
+    httpd = HTTPServer(("127.0.0.1", 0), api_server.SimpleHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}/frame", frames
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_full_then_delta_then_not_modified(api_server, server, monkeypatch):
+    url, frames = server
+    response = requests.get(url, params={"encoding": "rle"})
+    version = response.headers["X-Frame-Version"]
+    assert "X-Frame-Base" not in response.headers
+    buf = framebuffer.rle_decode_into(bytearray(FRAME_SIZE), response.content)
+    assert buf == frames[-1]
+
+    frames.append(bytearray(frames[-1]))
+    frames[-1][5000:5100] = b'\x00' * 100
+    response = requests.get(url, params={"encoding": "rle", "base": version})
+    assert response.headers["X-Frame-Base"] == version
+    framebuffer.rle_decode_into(buf, response.content, xor=True)
+    assert buf == frames[-1]
+
+    def no_encoding(data):
+        raise AssertionError("a 304 must not encode the frame")
+    monkeypatch.setattr(framebuffer, "rle_encode", no_encoding)
+    version = response.headers["X-Frame-Version"]
+    response = requests.get(url, params={"encoding": "rle", "base": version},
+                            headers={"If-None-Match": f'"{version}"'})
+    assert response.status_code == 304
+    assert api_server.FRAMES.stats["not_modified"] == 1
+
+
+def test_unknown_base_gets_a_full_frame(server):
+    url, frames = server
+    response = requests.get(url, params={"encoding": "rle", "base": "0" * 64})
+    assert "X-Frame-Base" not in response.headers
+    assert framebuffer.rle_decode_into(bytearray(FRAME_SIZE), response.content) == frames[-1]
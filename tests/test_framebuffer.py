@@ -0,0 +1,257 @@
+import os
+import random
+import sys
+
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'lib'))
+from waveshare_epd import framebuffer
+
+WIDTH = 800
+HEIGHT = 480
+SIZES = [(WIDTH, HEIGHT), (HEIGHT, WIDTH), (300, 200)]
+GRAYS = (0x00, 0x80, 0xC0, 0xFF)
+
+
+# The per-pixel routines EPD.getbuffer, getbuffer_4Gray and display_4Gray
+# used before the packing moved to framebuffer, kept as the reference
+# (display_4Gray's two copied plane loops differ only in the bit table).
+def old_getbuffer(image, width=WIDTH, height=HEIGHT):
+    buf = [0xFF] * (int(width / 8) * height)
+    image_monocolor = image.convert('1')
+    imwidth, imheight = image_monocolor.size
+    pixels = image_monocolor.load()
+    if imwidth == width and imheight == height:
+        for y in range(imheight):
+            for x in range(imwidth):
+                if pixels[x, y] == 0:
+                    buf[int((x + y * width) / 8)] &= ~(0x80 >> (x % 8))
+    elif imwidth == height and imheight == width:
+        for y in range(imheight):
+            for x in range(imwidth):
+                newx = y
+                newy = height - x - 1
+                if pixels[x, y] == 0:
+                    buf[int((newx + newy * width) / 8)] &= ~(0x80 >> (y % 8))
+    return buf
+
+
+def old_getbuffer_4Gray(image, width=WIDTH, height=HEIGHT):
+    buf = [0xFF] * (int(width / 4) * height)
+    image_monocolor = image.convert('L')
+    imwidth, imheight = image_monocolor.size
+    pixels = image_monocolor.load()
+    i = 0
+    if imwidth == width and imheight == height:
+        for y in range(imheight):
+            for x in range(imwidth):
+                if pixels[x, y] == 0xC0:
+                    pixels[x, y] = 0x80
+                elif pixels[x, y] == 0x80:
+                    pixels[x, y] = 0x40
+                i = i + 1
+                if i % 4 == 0:
+                    buf[int((x + (y * width)) / 4)] = ((pixels[x-3, y] & 0xc0) | (pixels[x-2, y] & 0xc0) >> 2 | (pixels[x-1, y] & 0xc0) >> 4 | (pixels[x, y] & 0xc0) >> 6)
+    elif imwidth == height and imheight == width:
+        for x in range(imwidth):
+            for y in range(imheight):
+                newx = y
+                newy = height - x - 1
+                if pixels[x, y] == 0xC0:
+                    pixels[x, y] = 0x80
+                elif pixels[x, y] == 0x80:
+                    pixels[x, y] = 0x40
+                i = i + 1
+                if i % 4 == 0:
+                    buf[int((newx + (newy * width)) / 4)] = ((pixels[x, y-3] & 0xc0) | (pixels[x, y-2] & 0xc0) >> 2 | (pixels[x, y-1] & 0xc0) >> 4 | (pixels[x, y] & 0xc0) >> 6)
+    return buf
+
+
+def old_display_4Gray(image):
+    # Returns the 0x24 and 0x26 planes instead of sending them.
+    planes = ([], [])
+    for plane, (c0, c00, c80, c40) in zip(planes, ((0x00, 0x01, 0x01, 0x00), (0x00, 0x01, 0x00, 0x01))):
+        for i in range(0, 48000):
+            temp3 = 0
+            for j in range(0, 2):
+                temp1 = image[i*2+j]
+                for k in range(0, 2):
+                    temp2 = temp1 & 0xC0
+                    if temp2 == 0xC0:
+                        temp3 |= c0
+                    elif temp2 == 0x00:
+                        temp3 |= c00
+                    elif temp2 == 0x80:
+                        temp3 |= c80
+                    else:  # 0x40
+                        temp3 |= c40
+                    temp3 <<= 1
+
+                    temp1 <<= 2
+                    temp2 = temp1 & 0xC0
+                    if temp2 == 0xC0:
+                        temp3 |= c0
+                    elif temp2 == 0x00:
+                        temp3 |= c00
+                    elif temp2 == 0x80:
+                        temp3 |= c80
+                    else:  # 0x40
+                        temp3 |= c40
+                    if j != 1 or k != 1:
+                        temp3 <<= 1
+                    temp1 <<= 2
+            plane.append(temp3)
+    return planes
+
+
+def noise(mode, size, levels, seed):
+    rng = random.Random(seed)
+    image = Image.new(mode, size)
+    image.putdata([rng.choice(levels) for _ in range(size[0] * size[1])])
+    return image
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_pack_1bit_matches_old_getbuffer(size):
+    image = noise('1', size, (0, 255), seed=1)
+    assert list(framebuffer.pack_1bit(image, WIDTH, HEIGHT)) == old_getbuffer(image)
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_pack_1bit_dithers_like_old_getbuffer(size):
+    image = noise('L', size, range(256), seed=2)
+    assert list(framebuffer.pack_1bit(image, WIDTH, HEIGHT)) == old_getbuffer(image)
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_pack_4gray_matches_old_getbuffer_4Gray(size):
+    image = noise('L', size, GRAYS, seed=3)
+    assert list(framebuffer.pack_4gray(image, WIDTH, HEIGHT)) == old_getbuffer_4Gray(image)
+
+
+def test_pack_4gray_other_levels_match_old_getbuffer_4Gray():
+    image = noise('L', (WIDTH, HEIGHT), range(256), seed=4)
+    assert list(framebuffer.pack_4gray(image, WIDTH, HEIGHT)) == old_getbuffer_4Gray(image)
+
+
+def test_gray_planes_match_old_display_4Gray():
+    buf = old_getbuffer_4Gray(noise('L', (WIDTH, HEIGHT), GRAYS, seed=5))
+    old_0x24, old_0x26 = old_display_4Gray(buf)
+    plane_0x24, plane_0x26 = framebuffer.gray_planes(buf)
+    assert list(plane_0x24) == old_0x24
+    assert list(plane_0x26) == old_0x26
+
+
+def frame(seed, changed_rows=()):
+    # A mostly white 1-bit frame with some rows of noise.
+    rng = random.Random(seed)
+    buf = bytearray(b'\xff' * (WIDTH // 8 * HEIGHT))
+    for row in changed_rows:
+        start = row * WIDTH // 8
+        buf[start:start + WIDTH // 8] = bytes(rng.choice((0x00, 0xFF, rng.randrange(256))) for _ in range(WIDTH // 8))
+    return buf
+
+
+@pytest.mark.parametrize("data", [
+    b'',
+    b'\x00',
+    b'\xff' * 4,
+    b'\xff' * 3 + b'\x00',
+    b'ab' * 100,
+    bytes(range(256)) * 3,
+    b'\x00' * 200 + b'x' + b'\x00' * 20000,
+])
+def test_rle_round_trip(data):
+    encoded = framebuffer.rle_encode(data)
+    assert bytes(framebuffer.rle_decode_into(bytearray(len(data)), encoded)) == data
+
+
+def test_rle_round_trip_frame():
+    buf = frame(6, changed_rows=range(40, 120))
+    encoded = framebuffer.rle_encode(buf)
+    assert len(encoded) < len(buf)
+    assert framebuffer.rle_decode_into(bytearray(len(buf)), encoded) == buf
+
+
+def test_rle_xor_delta_applies_to_base():
+    base = frame(7, changed_rows=range(0, 200, 3))
+    new = frame(8, changed_rows=range(100, 140))
+    delta = framebuffer.rle_encode(framebuffer.xor_bytes(new, base))
+    buf = bytearray(base)
+    assert framebuffer.rle_decode_into(buf, delta, xor=True) is buf
+    assert buf == new
+
+
+@pytest.mark.parametrize("cut", [1, 2, 5])
+def test_rle_truncated_input_raises(cut):
+    data = bytes(range(256)) + b'\x00' * 1000 + bytes(range(256))
+    encoded = framebuffer.rle_encode(data)
+    with pytest.raises(ValueError):
+        framebuffer.rle_decode_into(bytearray(len(data)), encoded[:-cut])
+
+
+def test_rle_cut_inside_a_header_raises():
+    encoded = framebuffer.rle_encode(b'\x00' * 1000)
+    assert encoded[0] & 0x80
+    with pytest.raises(ValueError):
+        framebuffer.rle_decode_into(bytearray(1000), encoded[:1])
+
+
+def test_rle_longer_than_frame_raises():
+    with pytest.raises(ValueError):
+        framebuffer.rle_decode_into(bytearray(10), framebuffer.rle_encode(b'\x00' * 11))
+
+
+def test_rle_shorter_than_frame_raises():
+    with pytest.raises(ValueError):
+        framebuffer.rle_decode_into(bytearray(10), framebuffer.rle_encode(b'\x00' * 9))
+
+
+def timeline_frames():
+    return [(1717236000 + 60 * i, frame(i, changed_rows=range(10 * i, 10 * i + 30))) for i in range(5)]
+
+
+def test_timeline_round_trip():
+    frames = timeline_frames()
+    blob = framebuffer.encode_timeline(frames, WIDTH // 8)
+    decoded = [(timestamp, bytes(buf)) for timestamp, buf in framebuffer.decode_timeline(blob)]
+    assert decoded == [(timestamp, bytes(buf)) for timestamp, buf in frames]
+
+
+def test_timeline_stores_only_changed_rows():
+    frames = timeline_frames()
+    frames[2] = (frames[2][0], frames[1][1])
+    blob = framebuffer.encode_timeline(frames, WIDTH // 8)
+    assert len(blob) < 5 * 40 * WIDTH // 8
+    assert [bytes(buf) for _, buf in framebuffer.decode_timeline(blob)][2] == bytes(frames[1][1])
+
+
+def test_empty_timeline():
+    assert list(framebuffer.decode_timeline(framebuffer.encode_timeline([], WIDTH // 8))) == []
+
+
+@pytest.mark.parametrize("cut", [1, 8, 100])
+def test_truncated_timeline_raises(cut):
+    blob = framebuffer.encode_timeline(timeline_frames(), WIDTH // 8)
+    with pytest.raises(ValueError):
+        list(framebuffer.decode_timeline(blob[:-cut]))
+
+
+@pytest.mark.parametrize("size", [0, 3, framebuffer.TIMELINE_HEADER.size + 4])
+def test_timeline_cut_before_first_frame_raises(size):
+    blob = framebuffer.encode_timeline(timeline_frames(), WIDTH // 8)
+    with pytest.raises(ValueError):
+        list(framebuffer.decode_timeline(blob[:size]))
+
+
+def test_timeline_with_trailing_bytes_raises():
+    blob = framebuffer.encode_timeline(timeline_frames(), WIDTH // 8)
+    with pytest.raises(ValueError):
+        list(framebuffer.decode_timeline(blob + b'\x00'))
+
+
+def test_timeline_bad_magic_raises():
+    blob = framebuffer.encode_timeline(timeline_frames(), WIDTH // 8)
+    with pytest.raises(ValueError):
+        list(framebuffer.decode_timeline(b'XXXX' + blob[4:]))
@@ -0,0 +1,69 @@
+import pytest
+from waveshare_epd import framebuffer
+
+import main as display
+
+NOW = 1717236000  # 2024-06-01 10:00 UTC
+
+
+@pytest.fixture
+def data():
+    return {
+        "buses": [
+            {"number": "4", "destination": "Slussen", "departure": NOW + 150},
+            {"number": "55", "destination": "Slussen", "departure": NOW + 420},
+        ],
+        "weather": {
+            "current_temp": "18.0°C",
+            "wind_kmh": "12.0 km/h",
+            "wind_condition": "Breeze",
+            "later_temp": "21.0°C",
+            "later_temp_time": "afternoon",
+            "precipitation": "10%",
+        },
+        "calendar": {},
+        "meta": {},
+        "tz": "Europe/Stockholm",
+    }
+
+
+@pytest.fixture
+def api(api_server, monkeypatch, data):
+    monkeypatch.setattr(api_server, "get_display_data", lambda profile=None, absolute=False: data)
+    monkeypatch.setattr(api_server.time, "time", lambda: NOW + 25)
+    return api_server
+
+
+def test_build_timeline_has_a_frame_per_minute(api):
+    profile = api.PROFILES[0]
+    # decode_timeline patches one buffer in place
+    blob = api.build_timeline(profile, minutes=5)
+    frames = [(timestamp, bytes(frame)) for timestamp, frame in framebuffer.decode_timeline(blob)]
+    assert [timestamp for timestamp, _ in frames] == [NOW + 60 * i for i in range(5)]
+    for timestamp, frame in frames:
+        image = display.render(api.get_display_data(profile, True), timestamp, profile.tz)
+        assert frame == bytes(framebuffer.pack_1bit(image, display.WIDTH, display.HEIGHT))
+
+
+def test_build_timeline_frames_differ_as_departures_count_down(api):
+    frames = [bytes(frame) for _, frame in framebuffer.decode_timeline(api.build_timeline(api.PROFILES[0], minutes=4))]
+    assert frames[0] != frames[1]
+    assert len(set(frames)) == 4
+
+
+def test_timeline_worker_stops_when_nobody_asks(api_server, monkeypatch):
+    builds = []
+    monkeypatch.setattr(api_server, "build_timeline", lambda profile: builds.append(profile) or b"blob")
+    monkeypatch.setattr(api_server, "TIMELINE_REBUILD", 0)
+    monkeypatch.setattr(api_server, "TIMELINE_IDLE_REBUILDS", 1)
+    timeline = api_server.FrameTimeline(api_server.PROFILES[0])
+    assert timeline.get() == b"blob"
+    worker = timeline.worker
+    worker.join(10)
+    assert not worker.is_alive()
+    # The requested build and one idle rebuild
+    assert len(builds) == 2
+    assert timeline.worker is None and timeline.blob is None
+    assert timeline.stats["stops"] == 1
+    assert timeline.get() == b"blob"
+    assert timeline.worker is not None
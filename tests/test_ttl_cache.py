@@ -0,0 +1,66 @@
+import threading
+import time
+
+import pytest
+
+
+@pytest.fixture
+def cache(api_server):
+    return api_server.TTLCache(8)
+
+
+def slow_fetch(release, value):
+    def fetch():
+        release.wait(5)
+        return value
+    return fetch
+
+
+def start_leader(cache, release, value="fresh"):
+    thread = threading.Thread(target=cache.get, args=("weather", "k", slow_fetch(release, value)))
+    thread.start()
+    while not cache.flights:
+        time.sleep(0.001)
+    return thread
+
+
+def test_follower_gets_the_leaders_value(cache):
+    release = threading.Event()
+    leader = start_leader(cache, release)
+    result = []
+    follower = threading.Thread(target=lambda: result.append(cache.get("weather", "k", lambda: "own")))
+    follower.start()
+    time.sleep(0.05)
+    release.set()
+    leader.join()
+    follower.join()
+    assert result == ["fresh"]
+    assert cache.stats["coalesced"] == 1
+
+
+def test_follower_gives_up_at_the_deadline(cache):
+    release = threading.Event()
+    leader = start_leader(cache, release)
+    started = time.monotonic()
+    assert cache.get("weather", "k", lambda: "own", deadline=started + 0.1) is None
+    assert 0.09 < time.monotonic() - started < 1
+    assert cache.stats["wait_timeouts"] == 1
+    release.set()
+    leader.join()
+
+
+def test_follower_falls_back_to_a_stale_value(api_server, cache, monkeypatch):
+    cache._store("weather", "k", "old")
+    ttl = api_server.CACHE_TTL["weather"]
+    monkeypatch.setitem(api_server.CACHE_TTL, "weather", 0)
+    release = threading.Event()
+    # The leader is the background refresh a stale hit starts
+    assert cache.get("weather", "k", slow_fetch(release, "fresh")) == "old"
+    while not cache.flights:
+        time.sleep(0.001)
+    assert cache._fetch_once("weather", "k", lambda: "own", deadline=time.monotonic() + 0.05) == "old"
+    monkeypatch.setitem(api_server.CACHE_TTL, "weather", ttl)
+    release.set()
+    while cache.refreshing:
+        time.sleep(0.001)
+    assert cache.get("weather", "k", lambda: "own") == "fresh"
@@ -0,0 +1,64 @@
+from datetime import datetime, timezone
+
+import pytest
+
+UTC = timezone.utc
+START = int(datetime(2024, 6, 1, tzinfo=UTC).timestamp())
+
+
+@pytest.fixture
+def forecast(api_server):
+    hours = 48
+    return api_server.WeatherForecast({
+        "time": [START + 3600 * h for h in range(hours)],
+        "temperature_2m": [float(h) for h in range(hours)],
+        "wind_speed_10m": [h * 3.0 for h in range(hours)],
+        "precipitation_probability": [h % 10 * 10 for h in range(hours)],
+    })
+
+
+def test_slot_is_looked_up_by_hour_column(forecast):
+    slot = forecast.at(START + 6 * 3600 + 1799, UTC)
+    assert slot == {
+        "current_temp": "6.0°C",
+        "wind_kmh": "18.0 km/h",
+        "wind_condition": "Fresh breeze",
+        "later_temp": "10.0°C",
+        "later_temp_time": "noon",
+        "precipitation": "90%",
+    }
+
+
+def test_later_temp_time_uses_the_signs_zone(api_server, forecast):
+    stockholm = api_server.get_timezone("Europe/Stockholm")
+    # Four hours after 05:00 UTC is 09:00 UTC, 11:00 in Stockholm
+    assert forecast.at(START + 5 * 3600, UTC)["later_temp_time"] == "night"
+    assert forecast.at(START + 5 * 3600, stockholm)["later_temp_time"] == "noon"
+    assert forecast.at(START + 15 * 3600, UTC)["later_temp_time"] == "afternoon"
+    assert forecast.at(START + 15 * 3600, stockholm)["later_temp_time"] == "night"
+
+
+def test_times_outside_the_forecast_clamp(forecast):
+    assert forecast.at(START - 86400, UTC)["current_temp"] == "0.0°C"
+    assert forecast.at(START + 86400 * 7, UTC)["current_temp"] == "47.0°C"
+    assert forecast.at(START + 86400 * 7, UTC)["later_temp"] == "47.0°C"
+
+
+def test_returned_slot_is_a_copy(forecast):
+    forecast.at(START, UTC)["current_temp"] = "changed"
+    assert forecast.at(START, UTC)["current_temp"] == "0.0°C"
+
+
+def test_missing_readings_show_as_not_available(api_server):
+    forecast = api_server.WeatherForecast({
+        "time": [START, START + 3600],
+        "temperature_2m": [None, 12.5],
+        "wind_speed_10m": [None, 4.0],
+        "precipitation_probability": [None, 20],
+    })
+    slot = forecast.at(START, UTC)
+    assert slot["current_temp"] == "N/A"
+    assert slot["wind_kmh"] == "N/A"
+    assert slot["wind_condition"] == "N/A"
+    assert slot["later_temp"] == "12.5°C"
+    assert slot["precipitation"] == "20%"